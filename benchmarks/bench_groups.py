@@ -0,0 +1,52 @@
+'''
+Time ValidatorEngine.validate on messages with many order groups, serially
+and with the order groups fanned out to a process pool (validate --jobs N).
+
+    python benchmarks/bench_groups.py [--jobs 2 4] [--groups 100 1000 5000]
+
+'''
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from hl7.parser import ValidatorEngine
+
+HEADER = '\n'.join(['MSH|^~\\&|XL2HL7|Test Lab^99999^CLIA|CalRedie|CDPH|20241030100306||ORU^R01^ORU_R01|103|P|2.5.1',
+                    'SFT|XL2HL7 Conversion|1.0|CalREDIE XC|1.0||20240105',
+                    'PID|1||8675309||Test^Rick^A||20200202|M||2033-9',
+                    'ORC|RE|Gon1001^Test Lab^99999^CLIA'])
+ORDER = '\n'.join(['OBR|1|Gon1001^Test Lab^99999^CLIA|Gon1001|21416-3|||20240229092624||||||Not Pregnant||||||||||20241030100306|||F',
+                   'OBX|1|CE|21416-3^N. gonorrhoeae DNA NAA+probe Ql (U)||260373001^Detected||NEG|A^Abnormal|||F||||||||20240229092624',
+                   'OBX|2|CE|21415-5^C. trachomatis DNA NAA+probe Ql (U)||260415000^Not detected||NEG|N|||F||||||||20240229092624',
+                   'SPM|1|^8675309|| ^Body fluid sample|||||||||||||20240228101533|20240228110000'])
+
+def best_time(function, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--groups', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    args = parser.parse_args()
+
+    engine = ValidatorEngine()
+    print(f"{os.cpu_count()} CPUs")
+    for groups in args.groups:
+        message = HEADER + '\n' + '\n'.join([ORDER] * groups)
+        line = f"{groups:6d} groups   serial {best_time(lambda: engine.validate(message)) * 1e3:8.1f} ms"
+        for jobs in args.jobs:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                engine.validate(message, executor) # start the workers
+                line += f"   --jobs {jobs} {best_time(lambda: engine.validate(message, executor)) * 1e3:8.1f} ms"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+'''
+Compare the compiled hl7._native and hl7.segments (if built, see setup.py) with their pure Python source.
+
+    python benchmarks/bench_native.py
+
+'''
+import importlib.util
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import hl7._native as native
+import hl7.segments as segments
+
+def load_pure(name='_native'):
+    path = os.path.join(os.path.dirname(__file__), '..', 'hl7', f'{name}.py')
+    spec = importlib.util.spec_from_file_location(f'hl7_{name}_pure', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+OBX = 'OBX|1|CE|21416-3^N. gonorrhoeae DNA NAA+probe Ql (U)||260373001^Detected||NEG|A^Abnormal|||F|||20240228101533|||^Roche cobas 8800 System||20240229092624||||ARUP^^^^^^^^^46D0523979|2023 Floyd Ave^Salt Lake City^UT^84108||||||'
+PID = 'PID|1||8675309||Test^Rick^A||20200202|M||2033-9|1234 Main Ln.^^Sacramento^CA^95814||^PRN^PH^^1^916^1234567|||||||||H|'
+MESSAGE = '\r\n'.join(['MSH|^~\\&|XL2HL7|Test Lab^99999^CLIA|CalRedie|CDPH|20241030100306||ORU^R01^ORU_R01|103|P|2.5.1']
+                      + [OBX] * 5000 + ['SPM|1|^8675309&ACC|| ^Body fluid sample'])
+
+def bench(module, number=20):
+    split = min(timeit.repeat(lambda: module.split_segments(MESSAGE, '\n'), number=number, repeat=5)) / number
+    values = min(timeit.repeat(lambda: [module.get_value(OBX, 23, 10), module.get_value(OBX, 3, 1),
+                                        module.get_value(OBX, 19)], number=number * 1000, repeat=5)) / (number * 1000)
+    return split, values
+
+def bench_segments(module, number=5000):
+    return min(timeit.repeat(lambda: (module.OBX(OBX).validate(), module.PID(PID).validate()),
+                             number=number, repeat=5)) / number
+
+def main():
+    pure = load_pure()
+    pure_split, pure_values = bench(pure)
+    pure_checks = bench_segments(load_pure('segments'))
+    print(f"pure Python   split_segments (5000 segments): {pure_split * 1e3:8.3f} ms   get_value x3: {pure_values * 1e6:6.2f} us"
+          f"   OBX+PID checks: {pure_checks * 1e6:6.2f} us")
+    if not native.COMPILED:
+        print("hl7._native is not compiled, build it with: pip install cython && python setup.py build_ext --inplace")
+        return
+    split, values = bench(native)
+    checks = bench_segments(segments)
+    print(f"compiled      split_segments (5000 segments): {split * 1e3:8.3f} ms   get_value x3: {values * 1e6:6.2f} us"
+          f"   OBX+PID checks: {checks * 1e6:6.2f} us")
+    print(f"speedup       split_segments: {pure_split / split:.2f}x   get_value: {pure_values / values:.2f}x"
+          f"   checks: {pure_checks / checks:.2f}x")
+
+if __name__ == "__main__":
+    main()
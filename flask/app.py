@@ -1,27 +1,35 @@
-from flask import Flask, render_template, request
-from hl7.parser import parse_message
-from waitress import serve
-import time, webbrowser
-import multiprocessing
+from flask import Flask, abort, current_app, jsonify, render_template, request
+from werkzeug.exceptions import HTTPException
+from hl7.parser import ValidatorEngine
+from hl7.cli import format_findings
+import argparse
+import codecs
+import threading, webbrowser
 import secrets
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex()
+# shared, read-only validation state: built once per process and used by every
+# waitress thread; each request only creates its own errors/warnings lists
+app.config['VALIDATOR_ENGINE'] = ValidatorEngine()
+# largest request body accepted, larger uploads get 413 Request Entity Too Large
+app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024
+# hl7.pool.ValidatorPool when started with --workers, None validates in the request thread
+app.config['VALIDATOR_POOL'] = None
+STREAM_CHUNK_SIZE = 64 * 1024
 
-def open_browser(url):
-    time.sleep(2)
-    webbrowser.open(url)
+def open_browser(url, delay=2):
+    # a timer thread is enough here, no need to spawn (and in a one-file
+    # build, re-unpack) a whole process just to open a browser tab
+    timer = threading.Timer(delay, webbrowser.open, args=(url,))
+    timer.daemon = True
+    timer.start()
 
-def validate_message(message):
-    errors, warnings = parse_message(message)
-    # print(f"errors: {errors}")
-    # print(f"warnings: {warnings}")
-    errors = [f"Error: {e}" for e in errors]
-    warnings = [f"Warning: {warning}" for warning in warnings]
-    output = errors + warnings
-    if not output:
-        output = ['Passed']
-    return '\n'.join(output)
+def validate_message(message, engine=None):
+    pool = current_app.config['VALIDATOR_POOL'] if engine is None else None
+    engine = engine or current_app.config['VALIDATOR_ENGINE']
+    errors, warnings = (pool or engine).validate(message)
+    return '\n'.join(format_findings(errors, warnings))
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -38,13 +46,70 @@ def index():
             output = ""
     return render_template("index.html", output=output, user_input=user_input)
 
+@app.route("/validate", methods=["POST"])
+def validate():
+    '''
+    Validate a message sent as the raw request body (e.g. curl --data-binary @message.hl7).
+    The body is read and validated in chunks and only the findings are returned, the
+    message is never echoed back.
+    '''
+    max_size = current_app.config['MAX_CONTENT_LENGTH']
+    if request.content_length is not None and max_size is not None and request.content_length > max_size:
+        abort(413)
+    stream = current_app.config['VALIDATOR_ENGINE'].stream()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    size = 0
+    try:
+        while True:
+            chunk = request.stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_size is not None and size > max_size: # chunked uploads have no Content-Length
+                abort(413)
+            stream.feed(decoder.decode(chunk))
+        stream.feed(decoder.decode(b'', final=True))
+        errors, warnings = stream.close()
+    except HTTPException:
+        raise
+    except Exception as e: # caught any exception when parsing the message
+        return jsonify(exception=str(e)), 400
+    return jsonify(passed=not errors, errors=errors, warnings=warnings)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='HL7 web validator')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=5000, help='port to listen on (default: 5000)')
+    parser.add_argument('--threads', type=int, default=4, help='waitress worker threads (default: 4)')
+    parser.add_argument('--connection-limit', type=int, default=100,
+                        help='maximum simultaneous connections accepted by waitress (default: 100)')
+    parser.add_argument('--max-size', type=float, default=64,
+                        help='largest accepted request body in megabytes (default: 64)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='validate in N pre-started worker processes instead of the request threads (default: 0)')
+    parser.add_argument('--worker-timeout', type=float, default=30,
+                        help='seconds a worker may spend on one message before it is restarted (default: 30)')
+    parser.add_argument('--no-browser', action='store_true', help='do not open a browser window')
+    parser.add_argument('--dev', action='store_true', help='use the development server (werkzeug) instead of waitress')
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    host = '127.0.0.1'
-    port = 5000
-    url = f"http://{host}:{port}"
-    multiprocessing.freeze_support()
-    multiprocessing.Process(target=open_browser, args=(url,)).start()
+    args = parse_args()
+    app.config['MAX_CONTENT_LENGTH'] = int(args.max_size * 1024 * 1024)
+    if args.workers:
+        import multiprocessing
+        from hl7.pool import ValidatorPool
+        multiprocessing.freeze_support() # worker processes of the one-file (pyinstaller) build
+        app.config['VALIDATOR_POOL'] = ValidatorPool(args.workers, timeout=args.worker_timeout,
+                                                     engine=app.config['VALIDATOR_ENGINE'])
+    url = f"http://{args.host}:{args.port}"
+    if not args.no_browser:
+        open_browser(url)
     print(f"Running on {url}")
     print(f"Press CTRL+C to quit")
-    # app.run(host=host, port=port) # use dev server
-    serve(app, host=host, port=port) # use prod server
+    if args.dev:
+        app.run(host=args.host, port=args.port, threaded=True) # use dev server
+    else:
+        from waitress import serve
+        serve(app, host=args.host, port=args.port, threads=args.threads,
+              connection_limit=args.connection_limit) # use prod server
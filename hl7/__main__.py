@@ -0,0 +1,4 @@
+import sys
+from hl7.cli import main
+
+sys.exit(main())
@@ -0,0 +1,66 @@
+'''
+Hot string paths of the parser: splitting a message into segments and
+reading a field/component/subcomponent value.
+
+This file is plain Python and is what runs by default. It is also written to
+compile with Cython (see setup.py): when the compiled extension module is
+built next to it, Python imports the extension instead of this file, so both
+run the very same code. COMPILED tells which one was loaded.
+
+'''
+from __future__ import annotations
+
+COMPILED = not __file__.endswith(('.py', '.pyc'))
+
+def split_segments(message: str, sep: str = '\n') -> tuple:
+    '''
+    Split a message into segments and segment names in a single pass
+
+    Args:
+        message (str): input HL7 V2 message
+        sep (str): string to separate each segment in HL7 message
+
+    Returns:
+        tuple: (segment_list, segment_name_list), see hl7.parser.segment_message
+    '''
+    segment_list: list = []
+    segment_name_list: list = []
+    segment: str
+    for segment in message.strip('\n\r').split(sep):
+        segment = segment.strip('\r')
+        if not segment.strip(): # blank or whitespace only lines are not segments
+            continue
+        segment_list.append(segment)
+        # only the text before the first '|', no need to split every field
+        segment_name_list.append(segment.partition('|')[0].strip())
+    return segment_list, segment_name_list
+
+def get_value(segment_text: str, field: int, component: int = 0, subcomponent: int = 0):
+    '''
+    Get a field, component or subcomponent value from a segment
+
+    Args:
+        segment_text (str): the whole segment, e.g. "PID|1||8675309|..."
+        field (int): field position, MSH-1 is the field separator itself
+        component (int): component position, 0 for the whole field
+        subcomponent (int): subcomponent position, 0 for the whole component
+
+    Returns:
+        str | None: the value, or None if it is missing or empty
+    '''
+    fields: list = segment_text.split('|')
+    if fields[0].strip() == 'MSH':
+        # MSH-1 is the field separator, so MSH fields are off by one
+        fields.insert(1, '|')
+        if field <= 2:
+            return fields[field] if field < len(fields) and fields[field] else None
+    if field >= len(fields):
+        return None
+    value: str = fields[field]
+    if component:
+        components: list = value.split('~', 1)[0].split('^') # first repetition only
+        value = components[component - 1] if component <= len(components) else ''
+        if subcomponent:
+            subcomponents: list = value.split('&')
+            value = subcomponents[subcomponent - 1] if subcomponent <= len(subcomponents) else ''
+    return value or None
@@ -0,0 +1,167 @@
+'''
+Command line entry point for validating HL7 messages without the web app.
+
+Only the standard library is imported here so that short-lived jobs
+(one process per file) spend their time validating instead of starting up.
+
+Usage:
+    python -m hl7 validate message1.hl7 message2.hl7
+    cat message.hl7 | python -m hl7 validate -
+    python -m hl7 export -p PID-7 -p OBX-5-1 -o results.parquet batch1.hl7 batch2.hl7
+    python -m hl7 watch /srv/sftp/incoming
+
+'''
+from __future__ import annotations
+import argparse
+import os
+import sys
+from hl7.parser import parse_message
+
+def format_findings(errors: list[str], warnings: list[str]) -> list[str]:
+    '''
+    Format errors and warnings the same way the web app displays them
+
+    Args:
+        errors (list[str]): error messages returned by parse_message
+        warnings (list[str]): warning messages returned by parse_message
+
+    Returns:
+        list[str]: one line per finding, or ['Passed'] if there are none
+    '''
+    output = [f"Error: {e}" for e in errors] + [f"Warning: {w}" for w in warnings]
+    if not output:
+        output = ['Passed']
+    return output
+
+def read_input(path: str) -> str:
+    '''
+    Read a whole message from a file path, or from stdin if path is '-'.
+    Bytes that are not UTF-8 (e.g. cp1252 feeds) are replaced instead of failing the file.
+    '''
+    if path == '-':
+        return sys.stdin.buffer.read().decode('utf-8', errors='replace')
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        return f.read()
+
+def validate_command(args: argparse.Namespace) -> int:
+    exit_code = 0
+    duplicate_index = None
+    if args.duplicate_index:
+        from hl7.dedup import open_index
+        duplicate_index = open_index(args.duplicate_index)
+    executor = None
+    # more processes than CPUs only adds overhead
+    jobs = min(args.jobs, os.cpu_count() or 1)
+    if jobs > 1:
+        # only worth it for messages with many order groups, see ValidatorEngine.validate
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=jobs)
+    for path in args.files:
+        try:
+            message = read_input(path)
+            errors, warnings = parse_message(message, executor)
+            if duplicate_index is not None:
+                warnings.extend(duplicate_index.check(message))
+        except Exception as e: # report and go on with the remaining files
+            print(f"{path}: Exception: {e}", file=sys.stderr)
+            exit_code = 1
+            continue
+        if errors:
+            exit_code = 1
+        for line in format_findings(errors, warnings):
+            print(f"{path}: {line}")
+    if executor is not None:
+        executor.shutdown()
+    if duplicate_index is not None:
+        duplicate_index.save(args.duplicate_index)
+    return exit_code
+
+def export_command(args: argparse.Namespace) -> int:
+    # imported here so validation alone never loads the exporter
+    from hl7.export import export_columns
+    from hl7.parser import iter_messages
+
+    def messages():
+        for path in args.files:
+            if path == '-':
+                yield from iter_messages(sys.stdin)
+            else:
+                with open(path, encoding='utf-8', errors='replace', newline='') as f:
+                    yield from iter_messages(f)
+
+    rows = export_columns(messages(), args.paths, args.output, format=args.format, batch_size=args.batch_size,
+                          row_segment=args.row_segment)
+    print(f"Exported {rows} rows to {args.output}")
+    return 0
+
+def watch_command(args: argparse.Namespace) -> int:
+    from hl7.spool import SpoolWatcher
+
+    watcher = SpoolWatcher(args.directory, pass_dir=args.pass_dir, fail_dir=args.fail_dir,
+                           checkpoint_path=args.checkpoint, interval=args.interval, settle=args.settle,
+                           duplicate_index_path=args.duplicate_index)
+    if args.once:
+        print(f"Processed {watcher.run_once()} files")
+        return 0
+    print(f"Watching {args.directory}, press CTRL+C to quit")
+    try:
+        watcher.run_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='hl7', description='Validate HL7 V2 messages.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    validate = subparsers.add_parser('validate', help='validate one message per file')
+    validate.add_argument('files', nargs='+', help="message files, or '-' to read from stdin")
+    validate.add_argument('--jobs', type=int, default=1,
+                          help='validate the order groups of large messages in up to this many processes, at most one per CPU (default: 1)')
+    validate.add_argument('--duplicate-index', default=None, metavar='PATH',
+                          help='flag duplicate MSH-10 / SPM-2-2-1 and MSH-13 gaps, remembering seen IDs in the directory PATH')
+    validate.set_defaults(func=validate_command)
+
+    export = subparsers.add_parser('export', help='extract fields of many messages into columns')
+    export.add_argument('files', nargs='+', help="files holding one or more messages, or '-' to read from stdin")
+    export.add_argument('-p', '--path', dest='paths', action='append', required=True,
+                        help='HL7 path to extract, e.g. PID-7 or OBX-5-1 (repeatable)')
+    export.add_argument('-o', '--output', required=True, help='output file')
+    export.add_argument('--format', choices=['parquet', 'csv'], default=None,
+                        help='overrides the format given by the output extension (.parquet or .csv); '
+                             'for other extensions the default is parquet if pyarrow is installed, csv otherwise')
+    export.add_argument('--row-segment', default=None, metavar='SEG',
+                        help="one row per occurrence of this segment (default: OBX if an OBX path is given), "
+                             "'' for one row per message")
+    export.add_argument('--batch-size', type=int, default=10000, help='rows held in memory before writing')
+    export.set_defaults(func=export_command)
+
+    watch = subparsers.add_parser('watch', help='validate files dropped into a directory')
+    watch.add_argument('directory', help='drop directory to watch')
+    watch.add_argument('--pass-dir', default=None, help='where passed files go (default: DIRECTORY/pass)')
+    watch.add_argument('--fail-dir', default=None, help='where failed files go (default: DIRECTORY/fail)')
+    watch.add_argument('--checkpoint', default=None, help='checkpoint file (default: DIRECTORY/.hl7-checkpoint.json)')
+    watch.add_argument('--interval', type=float, default=5.0, help='seconds between directory scans')
+    watch.add_argument('--settle', type=float, default=2.0, help='skip files modified less than this many seconds ago')
+    watch.add_argument('--duplicate-index', default=None, metavar='PATH',
+                       help='flag duplicate MSH-10 / SPM-2-2-1 and MSH-13 gaps, remembering seen IDs in the directory PATH')
+    watch.add_argument('--once', action='store_true', help='process pending files once and exit')
+    watch.set_defaults(func=watch_command)
+
+    return parser
+
+def main(argv: list[str] | None = None) -> int:
+    '''
+    Run the command line interface
+
+    Args:
+        argv (list[str] | None): arguments without the program name, defaults to sys.argv[1:]
+
+    Returns:
+        int: exit code, 0 if every message passed without errors, 1 otherwise
+    '''
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+'''
+Cross-message duplicate and sequence detection.
+
+Flags messages whose Message Control ID (MSH-10) or Accession Number
+(SPM-2-2-1) was already seen from the same sending facility (MSH-4), and
+gaps in the Sequence Number (MSH-13).
+
+Seen IDs are kept in Bloom filters, one per time window (by message date,
+MSH-7), and only the last few windows are kept. Memory stays fixed no matter
+how much traffic goes through. The trade-off is a small, configurable rate
+of false positives, so findings are reported as "possible" duplicates.
+
+On disk the index is a directory: index.json (settings, sequence numbers and
+the kept windows) and one file of filter bits per window. Window files are
+mapped copy-on-write when loaded, so opening an index reads only the pages a
+check touches, and save() writes back only the pages that changed.
+
+'''
+from __future__ import annotations
+from datetime import datetime, timezone
+import hashlib
+import json
+import math
+import mmap
+import os
+import time
+from hl7.parser import segment_message
+from hl7._native import get_value
+
+HEADER_NAME = 'index.json'
+PAGE_SIZE = 4096 # bytes, the unit in which changed filter bits are written back
+
+class BloomFilter:
+    '''
+    Fixed size set of strings that can answer "definitely not seen" or "probably seen"
+
+    Args:
+        capacity (int): number of keys it is sized for
+        error_rate (float): false positive rate at capacity
+    '''
+    def __init__(self, capacity: int, error_rate: float = 0.001, bits: bytearray | mmap.mmap | None = None):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be at least 1 and error_rate between 0 and 1.")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)) # in bits
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        # pages (of PAGE_SIZE bytes) changed since the bits were last written, None if never written
+        self.dirty = None if bits is None else set()
+
+    def positions(self, key: str) -> list[int]:
+        '''
+        Bit positions of key, the same for every filter with the same capacity and error_rate
+        '''
+        # double hashing: two 64-bit halves of one digest give all hash_count positions
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add_positions(self, positions: list[int]):
+        bits, dirty = self.bits, self.dirty
+        for position in positions:
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                if dirty is not None:
+                    dirty.add(byte // PAGE_SIZE)
+
+    def has_positions(self, positions: list[int]) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in positions)
+
+    def add(self, key: str):
+        self.add_positions(self.positions(key))
+
+    def __contains__(self, key: str) -> bool:
+        return self.has_positions(self.positions(key))
+
+def message_time(value: str | None) -> float | None:
+    '''
+    Convert an HL7 timestamp (YYYYMMDD[HHMM[SS]], offset ignored) to seconds since the epoch
+    '''
+    if not value:
+        return None
+    digits = value[:14]
+    for length, format in [(14, "%Y%m%d%H%M%S"), (12, "%Y%m%d%H%M"), (8, "%Y%m%d")]:
+        try:
+            moment = datetime.strptime(digits[:length], format)
+        except ValueError:
+            continue
+        return moment.replace(tzinfo=timezone.utc).timestamp()
+    return None
+
+class DuplicateIndex:
+    '''
+    Remember IDs across messages and report duplicates and sequence gaps
+
+    Args:
+        capacity (int): IDs expected per window (each message adds its control ID and accession numbers)
+        error_rate (float): false positive rate of each window at capacity
+        window (float): length of a time window in seconds, by message date (MSH-7)
+        windows (int): number of windows kept, older ones are evicted
+    '''
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001,
+                 window: float = 86400, windows: int = 31):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.window = window
+        self.windows = windows
+        self.filters = {} # window number -> BloomFilter
+        self.sequences = {} # sending facility -> last sequence number (MSH-13)
+        self.path = None # directory the window files were loaded from or last saved to
+
+    def filter_for(self, timestamp: float) -> BloomFilter | None:
+        '''
+        The filter of the window holding timestamp, evicting windows that fell out of range.
+        None if timestamp is older than every kept window.
+        '''
+        number = int(timestamp // self.window)
+        newest = max(self.filters, default=number)
+        if number > newest:
+            for old in [n for n in self.filters if n <= number - self.windows]:
+                del self.filters[old]
+        elif number <= newest - self.windows:
+            return None
+        if number not in self.filters:
+            self.filters[number] = BloomFilter(self.capacity, self.error_rate)
+        return self.filters[number]
+
+    def seen(self, key: str, timestamp: float) -> bool:
+        '''
+        Check whether key was seen in any kept window, then remember it in the
+        window of timestamp (so repeats keep the key from being evicted)
+        '''
+        return self.seen_all([key], timestamp)[0]
+
+    def seen_all(self, keys: list[str], timestamp: float) -> list[bool]:
+        '''
+        Same as seen() for the keys of one message: all of them are checked before
+        any is remembered, so keys of the same message never match each other
+        '''
+        bloom = self.filter_for(timestamp)
+        filters = list(self.filters.values())
+        # hash once, every window has the same size
+        positions = [(bloom or filters[0]).positions(key) for key in keys]
+        found = [any(other.has_positions(key_positions) for other in filters) for key_positions in positions]
+        if bloom is not None:
+            for key_positions in positions:
+                bloom.add_positions(key_positions)
+        return found
+
+    def check(self, message: str) -> list[str]:
+        '''
+        Check a message against everything seen before and remember it
+
+        Args:
+            message (str): input HL7 V2 message
+
+        Returns:
+            list[str]: warnings about duplicates and sequence gaps
+        '''
+        warnings = []
+        segment_list, segment_name_list = segment_message(message)
+        msh = next((text for name, text in zip(segment_name_list, segment_list) if name == 'MSH'), None)
+        if msh is None:
+            return warnings
+        facility = get_value(msh, 4) or ''
+        # undated or future dated messages count as received now, so a bad MSH-7
+        # cannot push every kept window out of range
+        now = time.time()
+        timestamp = min(message_time(get_value(msh, 7)) or now, now)
+
+        keys = {} # key -> warning if it was seen before
+        control_id = get_value(msh, 10)
+        if control_id:
+            keys[f"MSH-10\x00{facility}\x00{control_id}"] = f"Possible duplicate Message Control ID (MSH-10): {control_id}, already received from {facility}."
+        for name, text in zip(segment_name_list, segment_list):
+            if name != 'SPM':
+                continue
+            # a specimen shared by several order groups is listed once per group
+            accession = get_value(text, 2, 2, 1)
+            if accession:
+                keys[f"SPM-2-2-1\x00{facility}\x00{accession}"] = f"Possible duplicate Accession Number (SPM-2-2-1): {accession}, already received from {facility}."
+        if keys:
+            found = self.seen_all(list(keys), timestamp)
+            warnings.extend(warning for warning, duplicate in zip(keys.values(), found) if duplicate)
+
+        sequence = get_value(msh, 13)
+        if sequence:
+            try:
+                number = int(sequence)
+            except ValueError:
+                warnings.append(f"Invalid Sequence Number (MSH-13): {sequence}, should be a number.")
+            else:
+                last = self.sequences.get(facility)
+                if last is not None and number > last + 1:
+                    warnings.append(f"Gap in Sequence Number (MSH-13): {number - last - 1} message(s) missing between {last} and {number} from {facility}.")
+                elif last is not None and number <= last:
+                    warnings.append(f"Out of order Sequence Number (MSH-13): {number} received after {last} from {facility}.")
+                self.sequences[facility] = number if last is None else max(number, last)
+        return warnings
+
+    def save(self, path: str):
+        '''
+        Write the index to the directory path. Window files already there are updated
+        in place, page by page, with only what changed since the last save: filter bits
+        are only ever set, so a page half written by a crash still holds every bit it had.
+        '''
+        os.makedirs(path, exist_ok=True)
+        for number, bloom in self.filters.items():
+            bits_path = window_path(path, number)
+            if bloom.dirty is None or path != self.path or not os.path.exists(bits_path):
+                temp_path = bits_path + '.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(bloom.bits)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, bits_path)
+            elif bloom.dirty:
+                with open(bits_path, 'r+b') as f:
+                    for page in sorted(bloom.dirty):
+                        f.seek(page * PAGE_SIZE)
+                        f.write(bloom.bits[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+                    f.flush()
+                    os.fsync(f.fileno())
+            bloom.dirty = set()
+
+        header = {'capacity': self.capacity, 'error_rate': self.error_rate, 'window': self.window,
+                  'windows': self.windows, 'sequences': self.sequences, 'filters': sorted(self.filters)}
+        header_path = os.path.join(path, HEADER_NAME)
+        with open(header_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(header_path + '.tmp', header_path)
+        self.path = path
+
+        # windows evicted since the last save
+        kept = {os.path.basename(window_path(path, number)) for number in self.filters}
+        for name in os.listdir(path):
+            if name.startswith('window-') and name.endswith('.bits') and name not in kept:
+                os.remove(os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path: str) -> DuplicateIndex:
+        '''
+        Open an index written by save(), window files are mapped rather than read
+        '''
+        with open(os.path.join(path, HEADER_NAME), encoding='utf-8') as f:
+            header = json.load(f)
+        index = cls(header['capacity'], header['error_rate'], header['window'], header['windows'])
+        index.sequences = header['sequences']
+        index.path = path
+        byte_count = len(BloomFilter(index.capacity, index.error_rate).bits)
+        for number in header['filters']:
+            bits_path = window_path(path, number)
+            with open(bits_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size != byte_count:
+                    raise ValueError(f"Invalid duplicate index file: {bits_path}, it is truncated.")
+                # private mapping: changes stay in memory until save() writes them back
+                bits = mmap.mmap(f.fileno(), byte_count, access=mmap.ACCESS_COPY)
+            index.filters[number] = BloomFilter(index.capacity, index.error_rate, bits)
+        return index
+
+def window_path(path: str, number: int) -> str:
+    return os.path.join(path, f"window-{number}.bits")
+
+def open_index(path: str, **options) -> DuplicateIndex:
+    '''
+    Load the index saved in the directory path, or create a new one (with options) if there is none yet
+    '''
+    if os.path.exists(os.path.join(path, HEADER_NAME)):
+        return DuplicateIndex.load(path)
+    if os.path.isfile(path):
+        raise ValueError(f"Invalid duplicate index: {path}, should be a directory.")
+    return DuplicateIndex(**options)
@@ -0,0 +1,233 @@
+'''
+Bulk extraction of HL7 fields into columns for analytics.
+
+Values are written straight into one list per column instead of building a
+dict per message, then handed to pyarrow (Arrow record batches / Parquet)
+when it is installed, or written as CSV otherwise. pyarrow is optional and
+only imported when Arrow or Parquet output is requested.
+
+Paths use the usual HL7 notation: "PID-7" (field), "OBX-5-1" (component)
+and "SPM-2-2-1" (subcomponent). Each occurrence of the row segment (by
+default OBX, when any OBX path is requested) becomes one row. Columns of
+the other segments in its order group (ORC, OBR, SPM, ...) come from that
+same group, the rest (MSH, PID, ...) are repeated on every row of the
+message; in both cases the first occurrence is used. A message that does
+not match the required structure has no order groups, the first occurrence
+in the message is used for every column. Without a row segment each message
+becomes one row.
+
+'''
+from __future__ import annotations
+from collections.abc import Iterable
+import csv
+import os
+from hl7.parser import segment_message, parse_structure
+from hl7._native import get_value
+
+DEFAULT_BATCH_SIZE = 10000
+
+def parse_path(path: str) -> tuple[str, int, int, int]:
+    '''
+    Parse an HL7 path like "OBX-5-1" into its parts
+
+    Args:
+        path (str): "SEG-field", "SEG-field-component" or "SEG-field-component-subcomponent"
+
+    Returns:
+        tuple[str, int, int, int]: (segment, field, component, subcomponent),
+            component and subcomponent are 0 when not given
+    '''
+    parts = path.strip().split('-')
+    if not 2 <= len(parts) <= 4 or len(parts[0]) != 3:
+        raise ValueError(f"Invalid HL7 path: {path}, should look like PID-7, OBX-5-1 or SPM-2-2-1.")
+    try:
+        numbers = [int(part) for part in parts[1:]]
+    except ValueError:
+        raise ValueError(f"Invalid HL7 path: {path}, field, component and subcomponent must be numbers.") from None
+    if any(number < 1 for number in numbers):
+        raise ValueError(f"Invalid HL7 path: {path}, positions start at 1.")
+    numbers += [0] * (3 - len(numbers))
+    return (parts[0].upper(), numbers[0], numbers[1], numbers[2])
+
+class ColumnExtractor:
+    '''
+    Fill one column per HL7 path from a stream of messages
+
+    Args:
+        paths (list[str]): HL7 paths to extract, also used as column names
+        row_segment (str | None): segment that gets one row per occurrence, default 'OBX'
+            if any path is in OBX; '' for one row per message
+    '''
+    def __init__(self, paths: list[str], row_segment: str | None = None):
+        if not paths:
+            raise ValueError("At least one HL7 path is required.")
+        self.paths = list(paths)
+        # segment name -> [(column index, field, component, subcomponent)]
+        self.lookup = {}
+        for index, path in enumerate(self.paths):
+            segment, field, component, subcomponent = parse_path(path)
+            self.lookup.setdefault(segment, []).append((index, field, component, subcomponent))
+        if row_segment is None:
+            row_segment = 'OBX' if 'OBX' in self.lookup else ''
+        self.row_segment = row_segment.upper()
+        self.clear()
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def clear(self):
+        '''
+        Drop all rows collected so far, e.g. after a batch has been written
+        '''
+        self.columns = [[] for _ in self.paths]
+        self.rows = 0
+
+    def add(self, message: str):
+        '''
+        Extract one message into one row per occurrence of the row segment, or a
+        single row if the message has none
+        '''
+        lookup, row_segment = self.lookup, self.row_segment
+        message_row = [None] * len(self.paths)
+        group_values = {} # order group number -> [(column index, value)]
+        occurrences = [] # (order group number, [(column index, value)]) per row segment
+        seen = set()
+        segment_list, segment_name_list = segment_message(message)
+        group_of = self.order_groups(segment_name_list) if row_segment and len(lookup) > 1 else {}
+        for position, (segment_name, segment_text) in enumerate(zip(segment_name_list, segment_list)):
+            targets = lookup.get(segment_name)
+            if targets is None:
+                continue
+            group = group_of.get(position)
+            if segment_name == row_segment:
+                occurrences.append((group, [(index, get_value(segment_text, field, component, subcomponent))
+                                            for index, field, component, subcomponent in targets]))
+            elif (segment_name, group) not in seen:
+                seen.add((segment_name, group))
+                values = [(index, get_value(segment_text, field, component, subcomponent))
+                          for index, field, component, subcomponent in targets]
+                if group is None:
+                    for index, value in values:
+                        message_row[index] = value
+                else:
+                    group_values.setdefault(group, []).extend(values)
+                if not row_segment and len(seen) == len(lookup):
+                    break
+        for group, values in occurrences or [(None, [])]:
+            row = message_row.copy()
+            for index, value in group_values.get(group, []) + values:
+                row[index] = value
+            for column, value in zip(self.columns, row):
+                column.append(value)
+            self.rows += 1
+
+    @staticmethod
+    def order_groups(segment_name_list: list[str]) -> dict[int, int]:
+        '''
+        Number the order group of every segment that belongs to one
+
+        Returns:
+            dict[int, int]: segment index -> order group number, empty if the
+                message does not match the required structure
+        '''
+        root = parse_structure(segment_name_list)
+        if root is None:
+            return {}
+        _, orders = root.split_orders()
+        return {position: number for number, indices in enumerate(orders) for position in indices}
+
+    def extend(self, messages: Iterable[str]):
+        for message in messages:
+            self.add(message)
+
+    def to_dict(self) -> dict[str, list[str | None]]:
+        return dict(zip(self.paths, self.columns))
+
+    def to_arrow(self):
+        '''
+        Convert the collected columns into a pyarrow.RecordBatch (requires pyarrow)
+        '''
+        import pyarrow as pa
+        return pa.RecordBatch.from_arrays([pa.array(column, type=pa.string()) for column in self.columns],
+                                          names=self.paths)
+
+def has_pyarrow() -> bool:
+    try:
+        import pyarrow.parquet # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def output_format(output_path: str) -> str:
+    '''
+    Format to write output_path in: 'parquet' or 'csv' by its extension, for any
+    other extension parquet if pyarrow is installed and csv otherwise
+    '''
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    return 'parquet' if has_pyarrow() else 'csv'
+
+def export_columns(messages: Iterable[str], paths: list[str], output_path: str,
+                   format: str | None = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                   row_segment: str | None = None) -> int:
+    '''
+    Extract paths from a stream of messages and write them to a file, one batch at a time
+    so memory stays bounded by batch_size rows
+
+    Args:
+        messages (Iterable[str]): messages to extract, e.g. iter_messages(open(file))
+        paths (list[str]): HL7 paths to extract
+        output_path (str): file to write
+        format (str | None): 'parquet' or 'csv', default from the extension of output_path
+            (.parquet or .csv), otherwise parquet when pyarrow is installed and csv if not
+        batch_size (int): number of rows to collect before writing them out
+        row_segment (str | None): see ColumnExtractor
+
+    Returns:
+        int: number of rows written
+    '''
+    if format is None:
+        format = output_format(output_path)
+    if format not in ('parquet', 'csv'):
+        raise ValueError(f"Invalid format: {format}, should be either parquet or csv.")
+
+    extractor = ColumnExtractor(paths, row_segment)
+    total = 0
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for message in messages:
+                extractor.add(message)
+                if len(extractor) >= batch_size:
+                    batch = extractor.to_arrow()
+                    if writer is None:
+                        writer = pq.ParquetWriter(output_path, batch.schema)
+                    writer.write_batch(batch)
+                    total += len(extractor)
+                    extractor.clear()
+            if len(extractor) or writer is None:
+                batch = extractor.to_arrow()
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, batch.schema)
+                writer.write_batch(batch)
+                total += len(extractor)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(output_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(extractor.paths)
+            for message in messages:
+                extractor.add(message)
+                if len(extractor) >= batch_size:
+                    writer.writerows(zip(*extractor.columns))
+                    total += len(extractor)
+                    extractor.clear()
+            writer.writerows(zip(*extractor.columns))
+            total += len(extractor)
+    return total
@@ -0,0 +1,78 @@
+'''
+Rules across the segments of one order group (ORC/OBR, its OBX results and SPM specimens)
+
+'''
+from __future__ import annotations
+from datetime import datetime
+
+def parse_timestamp(value: str) -> datetime | None:
+    try:
+        return datetime.strptime(value, "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+
+class OrderGroup:
+    '''
+    Collects the few fields the group rules need from each segment (see summarize),
+    so a group can be checked without keeping its segments, e.g. large OBX-5
+    attachments, in memory.
+    '''
+    def __init__(self):
+        self.observations = [] # (OBX-2 Data Type, OBX-3-1 LOINC code, OBX-19 Test Resulted Date and Time)
+        self.collected = [] # SPM-17 Specimen Collected Date and Time
+
+    @staticmethod
+    def summarize(segment_name: str, segment_text: str) -> tuple | None:
+        '''
+        Extract the fields used by the group rules from one segment
+
+        Returns:
+            tuple | None: (segment_name, fields...), None for segments the rules don't use
+        '''
+        if segment_name == 'OBX':
+            fields = segment_text.split('|')
+            fields += [''] * (20 - len(fields))
+            return ('OBX', fields[2], fields[3].split('^')[0], fields[19])
+        if segment_name == 'SPM':
+            fields = segment_text.split('|')
+            return ('SPM', fields[17] if len(fields) > 17 else '')
+        return None
+
+    def add(self, summary: tuple | None):
+        if summary is None:
+            return
+        if summary[0] == 'OBX':
+            self.observations.append(summary[1:])
+        else:
+            self.collected.append(summary[1])
+
+    def validate(self) -> list[list[str]]:
+        '''
+        Validate the group and return a list of errors
+
+        Args: None
+
+        Returns: list[list[str]]
+        '''
+        errors, warnings = [], []
+        output = [errors, warnings]
+
+        # check the same Lab Test LOINC code (OBX-3-1) always uses the same Data Type (OBX-2)
+        data_types = {}
+        for data_type, code, _ in self.observations:
+            if not code or not data_type:
+                continue
+            if code in data_types and data_types[code] != data_type:
+                warnings.append(f"Inconsistent Data Type (OBX-2) for Lab Test LOINC code (OBX-3-1) {code}: {data_types[code]} and {data_type}.")
+            data_types.setdefault(code, data_type)
+
+        # check tests were not resulted (OBX-19) before the specimen was collected (SPM-17)
+        collected = [moment for moment in map(parse_timestamp, self.collected) if moment]
+        if collected:
+            first_collected = min(collected)
+            for _, _, resulted in self.observations:
+                moment = parse_timestamp(resulted)
+                if moment and moment < first_collected:
+                    errors.append(f"Invalid Test Resulted Date and Time (OBX-19): {resulted}, is before Specimen Collected Date and Time (SPM-17): {first_collected.strftime('%Y%m%d%H%M%S')}.")
+
+        return output
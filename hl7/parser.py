@@ -4,9 +4,16 @@
 3. check if there's missing segments
 
 '''
+from __future__ import annotations
 from hl7.segments import MSH, SFT, PID, ORC, OBR, OBX, SPM
+from hl7.groups import OrderGroup
+from hl7._native import split_segments
+from hl7.tables import CODE_TABLES
+from collections.abc import Iterable, Iterator
+from functools import lru_cache, partial
+from types import MappingProxyType
+import os
 import re
-from typing import List, Tuple, Union
 UNBOUND = -1
 '''
 REQUIRED_SEGMENTS = [('MSH', 1, 1),
@@ -39,7 +46,16 @@ REQUIRED_SEGMENTS = [('MSH', 1, 1),
                        ((('SPM', 1, 1), ('OBX', 0, UNBOUND)), 1, UNBOUND)), 0, UNBOUND),
                     ]
 
-def create_regex_pattern(required_segments: List[Tuple]) -> str:
+# segment classes with field level checks, looked up by segment name
+SEGMENT_VALIDATORS = {'MSH': MSH, 'SFT': SFT, 'PID': PID, 'ORC': ORC,
+                      'OBR': OBR, 'OBX': OBX, 'SPM': SPM}
+
+# fewer order groups than this are validated serially even when an executor is
+# given: a group takes well under a millisecond, less than sending it to another
+# process and back (see benchmarks/bench_groups.py)
+PARALLEL_MIN_GROUPS = 500
+
+def create_regex_pattern(required_segments: list[tuple]) -> str:
     """
     Converts the REQUIRED_SEGMENTS structure into a regex pattern.
     
@@ -50,7 +66,7 @@ def create_regex_pattern(required_segments: List[Tuple]) -> str:
     Returns:
         str: Regex pattern that matches valid segment sequences
     """
-    def convert_count_to_quantifier(min_count: int, max_count: Union[int, float]) -> str:
+    def convert_count_to_quantifier(min_count: int, max_count: int | float) -> str:
         """Convert min/max counts to regex quantifier"""
         if max_count == UNBOUND:
             return f'{{{min_count},}}'
@@ -59,7 +75,7 @@ def create_regex_pattern(required_segments: List[Tuple]) -> str:
         else:
             return f'{{{min_count},{max_count}}}'
     
-    def process_segment_tuple(segment_tuple: Tuple) -> str:
+    def process_segment_tuple(segment_tuple: tuple) -> str:
         """Process a single segment tuple or group of segments"""
         if isinstance(segment_tuple[0], tuple):  # Group of segments
             group_segments, min_group, max_group = segment_tuple
@@ -77,7 +93,7 @@ def create_regex_pattern(required_segments: List[Tuple]) -> str:
     full_pattern = '^' + ''.join(pattern_parts) + '$'
     return full_pattern
 
-def check_segments(segment_list: List[str]) -> bool:
+def check_segments(segment_list: list[str]) -> bool:
     """
     Validates if a list of segments follows the required pattern using regex.
     
@@ -87,17 +103,126 @@ def check_segments(segment_list: List[str]) -> bool:
     Returns:
         bool: True if segments follow the required pattern, False otherwise
     """
-    # Convert segment list to string for regex matching
-    segment_string = ''.join(segment_list)
-    
-    # Create regex pattern
-    pattern = create_regex_pattern(REQUIRED_SEGMENTS)
-    # print(f"pattern: {pattern}")
-    
-    # Match pattern against segment string
-    return bool(re.match(pattern, segment_string))
+    return default_engine().check_segments(segment_list)
+
+class SegmentGroup:
+    """
+    One occurrence of a group of REQUIRED_SEGMENTS in a message.
+
+    Args:
+        definition: the group's items from REQUIRED_SEGMENTS
+
+    Attributes:
+        children: segment indices (into the message's segment list) and nested
+            SegmentGroup objects, in message order
+    """
+    def __init__(self, definition: tuple):
+        self.definition = definition
+        self.children = []
+
+    def is_order(self) -> bool:
+        """
+        True for an order group (ORC/OBR with its OBX results and SPM specimens).
+        """
+        return any(item[0] == 'OBR' for item in self.definition)
+
+    def indices(self) -> list[int]:
+        """
+        Indices of all segments in this group and its nested groups, in order.
+        """
+        result = []
+        for child in self.children:
+            if isinstance(child, SegmentGroup):
+                result.extend(child.indices())
+            else:
+                result.append(child)
+        return result
+
+    def split_orders(self) -> tuple[list[int], list[list[int]]]:
+        """
+        Split the segments into the ones outside of order groups and one list per order group.
+
+        Returns:
+            tuple[list[int], list[list[int]]]: (other segment indices, [order group segment indices])
+        """
+        others, orders = [], []
+        for child in self.children:
+            if not isinstance(child, SegmentGroup):
+                others.append(child)
+            elif child.is_order():
+                orders.append(child.indices())
+            else:
+                child_others, child_orders = child.split_orders()
+                others.extend(child_others)
+                orders.extend(child_orders)
+        return others, orders
+
+@lru_cache(maxsize=None)
+def first_segments(item: tuple) -> frozenset:
+    """
+    Segment names a REQUIRED_SEGMENTS item can start with.
+    """
+    if not isinstance(item[0], tuple): # Single segment
+        return frozenset([item[0]])
+    names = set()
+    for child in item[0]:
+        names |= first_segments(child)
+        if child[1] > 0: # required, nothing after it can come first
+            break
+    return frozenset(names)
+
+def parse_structure(segment_name_list: list[str], required_segments: list[tuple] = REQUIRED_SEGMENTS) -> SegmentGroup | None:
+    """
+    Match segment names against the required structure and return the group tree.
 
-def segment_message(message: str, sep='\n') -> List[List[str]]:
+    Reads the segments once from left to right and decides every repetition by
+    the next segment name, so it never backtracks (REQUIRED_SEGMENTS is written
+    so that one segment of lookahead is always enough). Gives the same answer as
+    check_segments.
+
+    Args:
+        segment_name_list: List of segment names in order
+        required_segments: segment structure, see REQUIRED_SEGMENTS
+
+    Returns:
+        SegmentGroup | None: the whole message as a group, None if the structure is invalid
+    """
+    count_names = len(segment_name_list)
+    position = 0
+
+    def next_name() -> str | None:
+        nonlocal position
+        # empty names are skipped (left out of the tree), as check_segments ignores them
+        while position < count_names and not segment_name_list[position]:
+            position += 1
+        return segment_name_list[position] if position < count_names else None
+
+    def parse_items(items: tuple, group: SegmentGroup) -> bool:
+        nonlocal position
+        for item in items:
+            name_or_group, min_count, max_count = item
+            first = first_segments(item)
+            count = 0
+            while (max_count == UNBOUND or count < max_count) and next_name() in first:
+                if isinstance(name_or_group, tuple):
+                    child = SegmentGroup(name_or_group)
+                    if not parse_items(name_or_group, child):
+                        return False
+                    group.children.append(child)
+                else:
+                    group.children.append(position)
+                    position += 1
+                count += 1
+            if count < min_count:
+                return False
+        return True
+
+    root = SegmentGroup(tuple(required_segments))
+    if parse_items(root.definition, root) and next_name() is None:
+        return root
+    return None
+
+def segment_message(message: str, sep='\n') -> list[list[str]]:
     '''
     Args:
         message (str):
@@ -107,32 +232,240 @@ def segment_message(message: str, sep='\n') -> List[List[str]]:
             string to separate each segment in HL7 message
     
     Returns:
-        List[List[str]]: [segment_list, segment_name_list]
-            segment_list (List[str]): A list of segments
-            segment_name_list (List[str]): A list of segment names
+        list[list[str]]: [segment_list, segment_name_list], blank and whitespace only lines are dropped
+            segment_list (list[str]): A list of segments
+            segment_name_list (list[str]): A list of segment names
     '''
-    segment_list = message.strip('\n\r').split(sep)
-    segment_list = [segment.strip('\r') for segment in segment_list]
-    segment_name_list = [segment.split('|')[0].strip() for segment in segment_list]
+    segment_list, segment_name_list = split_segments(message, sep)
     return [segment_list, segment_name_list]
 
-def parse_message(message: str) -> List[List[str]]:
+def iter_messages(lines: Iterable[str]) -> Iterator[str]:
+    '''
+    Split a stream of lines holding one or more HL7 messages into messages.
+    A new message starts at every line beginning with "MSH|".
+
+    Args:
+        lines (Iterable[str]):
+            lines of a batch file, e.g. an open text file
+
+    Returns:
+        Iterator[str]: one message (its lines joined back together) at a time
+    '''
+    buffer = []
+    for line in lines:
+        if line.startswith('MSH|') and buffer:
+            # blank lines before the first message are not a message of their own
+            if ''.join(buffer).strip():
+                yield ''.join(buffer)
+            buffer = []
+        buffer.append(line)
+    if buffer and ''.join(buffer).strip():
+        yield ''.join(buffer)
+
+def validate_group(segments: list[tuple[str, str]], validators: dict = SEGMENT_VALIDATORS,
+                   tables: dict = CODE_TABLES) -> list[list[str]]:
+    """
+    Validate one order group as a unit: every segment, then the rules across
+    the group (see hl7.groups.OrderGroup). A plain module level function so it
+    can run in a thread or process pool.
+
+    Args:
+        segments: (segment_name, segment_text) of every segment in the group
+        validators: segment name -> class with a validate() method
+        tables: code table name -> frozenset of allowed codes, passed to the validators
+
+    Returns:
+        list[list[str]]: [errors, warnings]
+    """
     errors, warnings = [], []
     output = [errors, warnings]
-    segment_list, segment_name_list = segment_message(message)
-    result = check_segments(segment_name_list)
-
-    if not result:
-        errors.append("Invalid Message: Missing essential segments, should have all the following segments: MSH, SFT, PID, ORC, OBR, OBX, and SPM.")
-    else:
-        for segment_name, segment_text in zip(segment_name_list, segment_list):
-            if segment_name in ['MSH', 'SFT', 'PID', 'ORC', 'OBR', 'OBX', 'SPM']:
-                x = globals()[segment_name](segment_text)
-                temp_errors, temp_warnings = x.validate()
+    group = OrderGroup()
+    for segment_name, segment_text in segments:
+        if segment_name in validators:
+            temp_errors, temp_warnings = validators[segment_name](segment_text, tables).validate()
+            errors.extend(temp_errors)
+            warnings.extend(temp_warnings)
+        group.add(OrderGroup.summarize(segment_name, segment_text))
+    temp_errors, temp_warnings = group.validate()
+    errors.extend(temp_errors)
+    warnings.extend(temp_warnings)
+    return output
+
+class ValidatorEngine:
+    """
+    Compiled validation state: the segment structure (and its regex), the
+    segment validators and the code tables.
+
+    Build it once per process (it is the expensive part) and share it
+    between request handlers and threads. Nothing on the engine changes
+    after __init__ (the mappings are read-only views), and every validate()
+    call keeps its errors and warnings in its own local lists.
+
+    Args:
+        required_segments: segment structure, see REQUIRED_SEGMENTS
+        validators: segment name -> class taking (segment_text, tables) with a validate() method
+        tables: code table name -> frozenset of allowed codes, handed to every validator
+    """
+    def __init__(self, required_segments: list[tuple] = REQUIRED_SEGMENTS,
+                 validators: dict = SEGMENT_VALIDATORS, tables: dict = CODE_TABLES):
+        self.required_segments = tuple(required_segments)
+        self.structure = re.compile(create_regex_pattern(required_segments))
+        self.validators = MappingProxyType(dict(validators))
+        self.tables = MappingProxyType(dict(tables))
+
+    def __reduce__(self):
+        # rebuilt from its definition when sent to another process, e.g. by hl7.pool
+        return (type(self), (self.required_segments, dict(self.validators), dict(self.tables)))
+
+    def check_segments(self, segment_list: list[str]) -> bool:
+        """
+        Same as check_segments(), using this engine's compiled structure.
+        """
+        # segment names are joined without a separator, which is only unambiguous
+        # because every HL7 segment name has exactly 3 characters ('MSHSFT' or
+        # 'MS' + 'HSFT' must not pass as MSH + SFT); empty names add nothing
+        if any(segment_name and len(segment_name) != 3 for segment_name in segment_list):
+            return False
+        # Convert segment list to string for regex matching
+        return bool(self.structure.match(''.join(segment_list)))
+
+    def parse_structure(self, segment_name_list: list[str]) -> SegmentGroup | None:
+        """
+        Same as parse_structure(), using this engine's segment structure.
+        """
+        return parse_structure(segment_name_list, self.required_segments)
+
+    def validate(self, message: str, executor=None) -> list[list[str]]:
+        """
+        Validate a whole message. Segments outside of order groups are validated
+        one by one, each order group is validated as a unit (validate_group).
+
+        Args:
+            message: input HL7 V2 message
+            executor: optional thread or process pool (concurrent.futures) to
+                validate the order groups of very large messages in parallel, used
+                from PARALLEL_MIN_GROUPS order groups on
+
+        Returns:
+            list[list[str]]: [errors, warnings], in segment order either way
+        """
+        errors, warnings = [], []
+        output = [errors, warnings]
+        segment_list, segment_name_list = segment_message(message)
+        tree = self.parse_structure(segment_name_list)
+
+        if tree is None:
+            errors.append("Invalid Message: Missing essential segments, should have all the following segments: MSH, SFT, PID, ORC, OBR, OBX, and SPM.")
+        else:
+            validators = self.validators
+            others, orders = tree.split_orders()
+            for index in others:
+                segment_name = segment_name_list[index]
+                if segment_name in validators:
+                    x = validators[segment_name](segment_list[index], self.tables)
+                    temp_errors, temp_warnings = x.validate()
+                    errors.extend(temp_errors)
+                    warnings.extend(temp_warnings)
+
+            groups = [[(segment_name_list[i], segment_list[i]) for i in order] for order in orders]
+            if executor is None or len(groups) < PARALLEL_MIN_GROUPS:
+                results = [validate_group(group, validators, self.tables) for group in groups]
+            else:
+                # a few large batches per CPU rather than one process round trip per group
+                batch_size = -(-len(groups) // (4 * (os.cpu_count() or 1)))
+                results = executor.map(partial(validate_group, validators=dict(validators), tables=dict(self.tables)),
+                                       groups, chunksize=batch_size)
+            for temp_errors, temp_warnings in results:
                 errors.extend(temp_errors)
                 warnings.extend(temp_warnings)
 
-    return output
+        return output
+
+    def stream(self) -> MessageStream:
+        """
+        Start validating a message that arrives in chunks, see MessageStream.
+        """
+        return MessageStream(self)
+
+class MessageStream:
+    """
+    Validate one message fed in chunks, e.g. straight from a request body,
+    without holding the whole message in memory: every segment is validated
+    as soon as it is complete and only its findings are kept.
+
+    The result of close() is the same as engine.validate(message) on the
+    whole message (segments separated by '\n').
+
+    Args:
+        engine: the ValidatorEngine to validate with
+    """
+    def __init__(self, engine: ValidatorEngine):
+        self.engine = engine
+        self.pending = [] # pieces of the segment not terminated yet
+        self.segment_name_list = []
+        self.findings = [] # (errors, warnings) of each segment, None if it has no validator
+        self.summaries = [] # fields kept for the order group rules, see OrderGroup.summarize
+
+    def feed(self, chunk: str):
+        if '\n' not in chunk:
+            self.pending.append(chunk)
+            return
+        self.pending.append(chunk)
+        segments = ''.join(self.pending).split('\n')
+        self.pending = [segments.pop()]
+        for segment in segments:
+            self.add_segment(segment)
+
+    def add_segment(self, segment: str):
+        segment = segment.strip('\r')
+        if not segment.strip(): # blank lines are dropped, as in segment_message
+            return
+        segment_name = segment.split('|')[0].strip()
+        self.segment_name_list.append(segment_name)
+        validator = self.engine.validators.get(segment_name)
+        self.findings.append(validator(segment, self.engine.tables).validate() if validator else None)
+        self.summaries.append(OrderGroup.summarize(segment_name, segment))
+
+    def close(self) -> list[list[str]]:
+        """
+        Validate the last segment, the segment structure and the order groups.
+
+        Returns:
+            list[list[str]]: [errors, warnings]
+        """
+        self.add_segment(''.join(self.pending))
+        self.pending = []
+        errors, warnings = [], []
+        output = [errors, warnings]
+        tree = self.engine.parse_structure(self.segment_name_list)
+        if tree is None:
+            errors.append("Invalid Message: Missing essential segments, should have all the following segments: MSH, SFT, PID, ORC, OBR, OBX, and SPM.")
+            return output
+
+        others, orders = tree.split_orders()
+        findings = [self.findings[index] for index in others]
+        for order in orders:
+            group = OrderGroup()
+            for index in order:
+                findings.append(self.findings[index])
+                group.add(self.summaries[index])
+            findings.append(group.validate())
+        for finding in findings:
+            if finding is not None:
+                errors.extend(finding[0])
+                warnings.extend(finding[1])
+        return output
+
+@lru_cache(maxsize=None)
+def default_engine() -> ValidatorEngine:
+    """
+    The process wide engine used by check_segments() and parse_message(),
+    built on first use so importing the parser stays cheap.
+    """
+    return ValidatorEngine()
+
+def parse_message(message: str, executor=None) -> list[list[str]]:
+    return default_engine().validate(message, executor)
 
 def main():
     message = r'''MSH|^~\&|XL2HL7^1.10.100.1.111111.1.101^ISO|Test Lab^99999^CLIA|CalRedie|CDPH|20241030100306||ORU^R01^ORU_R01|103|P|2.5.1|||NE|NE|||||PHLabReport-NoAck^^^ISO
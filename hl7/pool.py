@@ -0,0 +1,281 @@
+'''
+Pool of pre-started validation worker processes.
+
+The pool starts a fixed number of worker processes once and keeps them. Each
+worker gets the ValidatorEngine (compiled structure, validators and code
+tables) when it starts, so nothing is loaded per request. A supervisor thread
+in the parent hands messages to idle workers over pipes, collects results,
+and replaces workers that crash or run past the timeout.
+
+Where available (Linux, macOS) workers, including replacements, are forked
+from a fork server: a small single-threaded process started with the pool
+that has already imported the parser, segment validators and code tables,
+which the workers then share copy-on-write. Forking the web app itself is
+avoided, a process running many threads can hand a new worker a lock that
+another thread held at that moment and never releases. Elsewhere (Windows)
+workers are spawned and import everything themselves.
+
+    pool = ValidatorPool(processes=4, timeout=30)
+    errors, warnings = pool.validate(message)
+    pool.close()
+
+'''
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import gc
+import itertools
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import threading
+import time
+from hl7.parser import ValidatorEngine, default_engine
+
+# imported once by the fork server, before it forks any worker
+PRELOAD_MODULES = ['hl7.parser']
+
+class WorkerCrashed(RuntimeError):
+    '''
+    The worker process validating a message died before returning a result
+    '''
+
+def worker_main(connection, engine: ValidatorEngine):
+    '''
+    Worker process loop: receive (job_id, message), send back (job_id, ok, result)
+    '''
+    # keep the garbage collector from writing to (and so copying) the objects shared with the fork server
+    gc.freeze()
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None: # shutdown
+            return
+        job_id, message = job
+        try:
+            connection.send((job_id, True, engine.validate(message)))
+        except Exception as e: # report the exception to the caller instead of dying
+            connection.send((job_id, False, f"{type(e).__name__}: {e}"))
+
+class Worker:
+    def __init__(self, context, engine: ValidatorEngine):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_connection, engine), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.job = None # (job_id, future, deadline) while busy
+
+    def stop(self, timeout: float = 1.0):
+        try:
+            self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+class ValidatorPool:
+    '''
+    Fixed pool of pre-started worker processes that validate messages
+
+    Args:
+        processes (int | None): number of worker processes, default os.cpu_count()
+        timeout (float | None): seconds a message may take before its worker is killed and
+            replaced (the call fails with TimeoutError), None for no limit
+        engine (ValidatorEngine | None): engine the workers validate with, default default_engine()
+        start_method (str | None): multiprocessing start method, default "forkserver" where
+            available and "spawn" otherwise
+    '''
+    def __init__(self, processes: int | None = None, timeout: float | None = 30.0,
+                 engine: ValidatorEngine | None = None, start_method: str | None = None):
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            self.context.set_forkserver_preload(PRELOAD_MODULES)
+        self.timeout = timeout
+        self.engine = engine or default_engine()
+
+        self.lock = threading.Lock()
+        self.pending = deque() # (job_id, message, future) waiting for an idle worker
+        self.job_ids = itertools.count()
+        self.closed = False
+        self.restarts = 0
+        self.wakeup_reader, self.wakeup_writer = self.context.Pipe(duplex=False)
+        self.workers = [Worker(self.context, self.engine) for _ in range(processes or os.cpu_count() or 1)]
+        self.supervisor = threading.Thread(target=self.supervise, name='hl7-validator-pool', daemon=True)
+        self.supervisor.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, message: str) -> Future:
+        '''
+        Queue a message for validation
+
+        Returns:
+            Future: resolves to [errors, warnings]
+        '''
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("ValidatorPool is closed.")
+            self.pending.append((next(self.job_ids), message, future))
+            self.wakeup_writer.send_bytes(b'')
+        return future
+
+    def validate(self, message: str, timeout: float | None = None) -> list[list[str]]:
+        '''
+        Validate a message in a worker process and wait for the result
+
+        Args:
+            message (str): input HL7 V2 message
+            timeout (float | None): seconds to wait, time in the queue included; by default
+                long enough for every message queued ahead of it to use the pool's timeout
+
+        Returns:
+            list[list[str]]: [errors, warnings]
+        '''
+        with self.lock:
+            queued = len(self.pending)
+        future = self.submit(message)
+        if timeout is None and self.timeout is not None:
+            # each round of messages ahead in the queue, then this one, plus one round of slack
+            timeout = self.timeout * (queued // len(self.workers) + 2)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel() # dropped if it is still queued
+            raise TimeoutError(f"No validation result within {timeout} seconds.") from None
+
+    def close(self):
+        '''
+        Stop the supervisor and the workers, messages still queued are cancelled
+        '''
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.wakeup_writer.send_bytes(b'')
+        self.supervisor.join()
+
+    def restart(self, index: int):
+        worker = self.workers[index]
+        worker.process.kill()
+        worker.stop(timeout=0)
+        self.workers[index] = Worker(self.context, self.engine)
+        self.restarts += 1
+
+    def next_job(self) -> tuple | None:
+        with self.lock:
+            while self.pending:
+                job_id, message, future = self.pending.popleft()
+                # running: put back after its worker died before receiving it
+                if future.running() or future.set_running_or_notify_cancel():
+                    return job_id, message, future
+        return None
+
+    def dispatch(self):
+        '''
+        Hand queued messages to idle workers
+        '''
+        for index, worker in enumerate(self.workers):
+            if worker.job is not None:
+                continue
+            job = self.next_job()
+            if job is None:
+                return
+            job_id, message, future = job
+            deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+            try:
+                worker.connection.send((job_id, message))
+            except (OSError, ValueError): # the worker died while idle, not the message's fault
+                with self.lock:
+                    self.pending.appendleft(job)
+                    self.wakeup_writer.send_bytes(b'') # dispatch again after the restart
+                self.restart(index)
+            else:
+                worker.job = (job_id, future, deadline)
+
+    def check_worker(self, index: int, ready: list):
+        '''
+        Collect the result of one worker, replace it if it died or ran out of time
+        '''
+        worker = self.workers[index]
+        if worker.job and worker.connection in ready:
+            try:
+                job_id, ok, result = worker.connection.recv()
+            except (EOFError, OSError):
+                pass # died while answering, handled as a crash below
+            else:
+                future, worker.job = worker.job[1], None
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(RuntimeError(result))
+                return
+        if worker.process.sentinel in ready or not worker.process.is_alive():
+            crashed = True
+        elif worker.job and worker.job[2] is not None and time.monotonic() >= worker.job[2]:
+            crashed = False
+        else:
+            return
+        # replace the worker first, so a caller retrying right away finds the pool whole
+        # (if that fails, the job is still on the worker and failed when the supervisor stops)
+        self.restart(index)
+        job, worker.job = worker.job, None
+        if job and crashed:
+            job[1].set_exception(WorkerCrashed(f"Validation worker exited with code {worker.process.exitcode}."))
+        elif job:
+            job[1].set_exception(TimeoutError(f"Validation took longer than {self.timeout} seconds."))
+
+    def supervise(self):
+        error = None
+        try:
+            while not self.closed:
+                self.dispatch()
+                deadlines = [worker.job[2] for worker in self.workers if worker.job and worker.job[2] is not None]
+                wait_time = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                ready = wait([self.wakeup_reader]
+                             + [worker.connection for worker in self.workers if worker.job]
+                             + [worker.process.sentinel for worker in self.workers], wait_time)
+                if self.wakeup_reader in ready:
+                    while self.wakeup_reader.poll():
+                        self.wakeup_reader.recv_bytes()
+                for index in range(len(self.workers)):
+                    try:
+                        self.check_worker(index, ready)
+                    except Exception as e: # e.g. a result that cannot be unpickled, fail only this message
+                        worker = self.workers[index]
+                        self.restart(index)
+                        job, worker.job = worker.job, None
+                        if job:
+                            job[1].set_exception(e)
+        except Exception as e: # e.g. no new worker can be started, callers must not wait forever
+            error = RuntimeError(f"ValidatorPool stopped: {type(e).__name__}: {e}")
+        finally:
+            with self.lock:
+                self.closed = True
+                pending, self.pending = self.pending, deque()
+            for worker in self.workers:
+                if worker.job:
+                    worker.job[1].set_exception(error or RuntimeError("ValidatorPool was closed."))
+                    worker.job = None
+                try:
+                    worker.stop()
+                except Exception:
+                    pass
+            for _, _, future in pending:
+                if error is None:
+                    future.cancel()
+                if not future.done():
+                    future.set_exception(error or RuntimeError("ValidatorPool was closed."))
+            self.wakeup_reader.close()
+            self.wakeup_writer.close()
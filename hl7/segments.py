@@ -1,21 +1,26 @@
 '''
 Definition of each segment
 
+Each class takes the segment text and the code tables (name -> allowed codes,
+see hl7.tables) that its coded fields are checked against.
+
 '''
-from typing import List
+from __future__ import annotations
 from datetime import datetime
+from hl7.tables import CODE_TABLES
 
 class MSH:
-    def __init__(self, text):
+    def __init__(self, text, tables=CODE_TABLES):
         self.text = text
+        self.tables = tables
     
-    def validate(self) -> List[List[str]]:
+    def validate(self) -> list[list[str]]:
         '''
         Validate the segment text and return a list of errors
 
         Args: None
 
-        Returns: List[List[str]]
+        Returns: list[list[str]]
         '''
         errors, warnings = [], []
         output = [errors, warnings]
@@ -96,16 +101,17 @@ class MSH:
         return output
 
 class SFT:
-    def __init__(self, text):
+    def __init__(self, text, tables=CODE_TABLES):
         self.text = text
+        self.tables = tables
     
-    def validate(self) -> List[List[str]]:
+    def validate(self) -> list[list[str]]:
         '''
         Validate the segment text and return a list of errors
 
         Args: None
 
-        Returns: List[List[str]]
+        Returns: list[list[str]]
         '''
         errors, warnings = [], []
         output = [errors, warnings]
@@ -128,16 +134,17 @@ class SFT:
         return output
 
 class PID:
-    def __init__(self, text):
-        self.text = text  
+    def __init__(self, text, tables=CODE_TABLES):
+        self.text = text
+        self.tables = tables
     
-    def validate(self) -> List[List[str]]:
+    def validate(self) -> list[list[str]]:
         '''
         Validate the segment text and return a list of errors
 
         Args: None
 
-        Returns: List[List[str]]
+        Returns: list[list[str]]
         '''
         errors, warnings = [], []
         output = [errors, warnings]
@@ -184,7 +191,7 @@ class PID:
         if 8 > fields_count or not fields[8]:
             errors.append("Missing Patient Sex (PID-8).")
         else:
-            if fields[8] not in ['F', 'M', 'O', 'U']:
+            if fields[8] not in self.tables['ADMINISTRATIVE_SEX']:
                 errors.append(f"Invalid Patient Sex: {fields[8]}, should be either F, M, O, or U.")
 
 
@@ -215,16 +222,17 @@ class PID:
         return output
 
 class ORC:
-    def __init__(self, text):
+    def __init__(self, text, tables=CODE_TABLES):
         self.text = text
+        self.tables = tables
     
-    def validate(self) -> List[List[str]]:
+    def validate(self) -> list[list[str]]:
         '''
         Validate the segment text and return a list of errors
 
         Args: None
 
-        Returns: List[List[str]]
+        Returns: list[list[str]]
         '''
         errors, warnings = [], []
         output = [errors, warnings]
@@ -259,16 +267,17 @@ class ORC:
         return output
 
 class OBR:
-    def __init__(self, text):
+    def __init__(self, text, tables=CODE_TABLES):
         self.text = text
+        self.tables = tables
     
-    def validate(self) -> List[List[str]]:
+    def validate(self) -> list[list[str]]:
         '''
         Validate the segment text and return a list of errors
 
         Args: None
 
-        Returns: List[List[str]]
+        Returns: list[list[str]]
         '''
         errors, warnings = [], []
         output = [errors, warnings]
@@ -286,7 +295,7 @@ class OBR:
         if 13 > fields_count or not fields[13]:
             errors.append("Missing Relevant Clinical Information (OBR-13).")
         else:
-            if fields[13] not in ['Prenatal', 'Not Pregnant', 'Unknown Pregnancy']:
+            if fields[13] not in self.tables['RELEVANT_CLINICAL_INFO']:
                 errors.append(f"Invalid Relevant Clinical Information: {fields[13]}, should be either Prenatal, Not Pregnant, or Unknown Pregnancy.")
 
         # check OBR-16 Ordering Provider National Provider Identifier (NPI) and Name
@@ -305,7 +314,7 @@ class OBR:
         if 25 > fields_count or not fields[25]:
             errors.append("Missing Result Status (OBR-25).")
         else:
-            if fields[25] not in ['F', 'P', 'C']:
+            if fields[25] not in self.tables['RESULT_STATUS']:
                 errors.append(f"Invalid Result Status (OBR-25): {fields[25]}, should be either F, P, or C.")
 
         # # check OBR-31 Reason for Study: Use ICD-10 Diagnosis Code
@@ -317,16 +326,17 @@ class OBR:
         return output
 
 class OBX:
-    def __init__(self, text):
+    def __init__(self, text, tables=CODE_TABLES):
         self.text = text
+        self.tables = tables
     
-    def validate(self) -> List[List[str]]:
+    def validate(self) -> list[list[str]]:
         '''
         Validate the segment text and return a list of errors
 
         Args: None
 
-        Returns: List[List[str]]
+        Returns: list[list[str]]
         '''
         errors, warnings = [], []
         output = [errors, warnings]
@@ -345,7 +355,7 @@ class OBX:
         if 2 > fields_count or not fields[2]:
             errors.append("Missing Data Type (OBX-2).")
         else:
-            if fields[2] not in ['SN', 'CWE', 'CNE', 'FT', 'ST', 'TX', 'TS', 'TM', 'DT', 'CE']:
+            if fields[2] not in self.tables['VALUE_TYPE']:
                 errors.append(f"Invalid Data Type (OBX-2): {fields[2]}, should be either SN, CWE, CNE, FT, ST, TX, TS, TM, DT, or CE.")
             else:
                 data_type = fields[2]
@@ -421,7 +431,7 @@ class OBX:
         if 11 > fields_count or not fields[11]:
             errors.append("Missing Observation Result Status (OBX-11).")
         else:
-            if fields[11] not in ['F', 'P', 'C']:
+            if fields[11] not in self.tables['OBSERVATION_RESULT_STATUS']:
                 errors.append(f"Invalid Observation Result Status (OBX-11): {fields[11]}, should be either F, P, or C.")
 
 
@@ -472,16 +482,17 @@ class OBX:
         return output
 
 class SPM:
-    def __init__(self, text):
+    def __init__(self, text, tables=CODE_TABLES):
         self.text = text
+        self.tables = tables
     
-    def validate(self) -> List[List[str]]:
+    def validate(self) -> list[list[str]]:
         '''
         Validate the segment text and return a list of errors
 
         Args: None
 
-        Returns: List[List[str]]
+        Returns: list[list[str]]
         '''
         errors, warnings = [], []
         output = [errors, warnings]
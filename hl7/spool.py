@@ -0,0 +1,278 @@
+'''
+Spool ingestion: watch a drop directory, validate every file that lands in it
+and move it to a pass or fail folder with a report next to it.
+
+Progress is saved in a small JSON checkpoint store (byte offset of the next
+message, message index and report size per file), so after a crash or
+restart a large file is resumed where it stopped instead of re-validated
+from the start. The entry also records the file's inode, size and mtime; a
+file re-uploaded under the same name is validated from the start.
+
+Files are never overwritten in the pass and fail folders, a second file with
+the same name is stored as <stem>-1<ext>, <stem>-2<ext>, ...
+
+Layout (defaults):
+    <directory>/                    files dropped by the partner
+    <directory>/pass/               files without errors + <name>.report.txt
+    <directory>/fail/               files with errors + <name>.report.txt
+    <directory>/.hl7-checkpoint.json
+
+'''
+from __future__ import annotations
+from collections.abc import Iterator
+import io
+import json
+import os
+import sys
+import time
+from hl7.parser import parse_message
+from hl7.cli import format_findings
+
+CHECKPOINT_NAME = '.hl7-checkpoint.json'
+REPORT_SUFFIX = '.report.txt'
+
+def iter_messages_with_offsets(f: io.BufferedIOBase) -> Iterator[tuple[str, int]]:
+    '''
+    Split a binary file into messages, starting from its current position
+
+    Args:
+        f (io.BufferedIOBase): file opened in binary mode
+
+    Returns:
+        Iterator[tuple[str, int]]: (message, offset) pairs, offset is where the
+            next message starts, i.e. where to resume after this message
+    '''
+    buffer = []
+    while True:
+        start = f.tell()
+        line = f.readline()
+        if not line:
+            break
+        if line.startswith(b'MSH|') and buffer:
+            # blank lines before the first message are not a message of their own
+            if b''.join(buffer).strip():
+                yield b''.join(buffer).decode('utf-8', errors='replace'), start
+            buffer = []
+        buffer.append(line)
+    if buffer and b''.join(buffer).strip():
+        yield b''.join(buffer).decode('utf-8', errors='replace'), f.tell()
+
+def file_identity(stat: os.stat_result) -> list[int]:
+    '''
+    What tells a file apart from another one later uploaded under the same name
+    '''
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+class Checkpoint:
+    '''
+    Progress of files being validated, saved as JSON and replaced atomically
+
+    Args:
+        path (str): path of the checkpoint file
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def get(self, name: str) -> dict | None:
+        return self.entries.get(name)
+
+    def update(self, name: str, **state):
+        self.entries.setdefault(name, {}).update(state)
+        self.save()
+
+    def remove(self, name: str):
+        if self.entries.pop(name, None) is not None:
+            self.save()
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+class SpoolWatcher:
+    '''
+    Validate files dropped into a directory and sort them into pass/fail folders
+
+    Args:
+        directory (str): drop directory to watch
+        pass_dir (str | None): where passed files go, default <directory>/pass
+        fail_dir (str | None): where failed files go, default <directory>/fail
+        checkpoint_path (str | None): checkpoint store, default <directory>/.hl7-checkpoint.json
+        interval (float): seconds between directory scans in run_forever
+        settle (float): skip files modified less than this many seconds ago (still uploading)
+        checkpoint_every (int): save progress after this many messages
+        duplicate_index_path (str | None): if given, also flag duplicates and sequence gaps
+            (see hl7.dedup) and save the index there with every checkpoint
+    '''
+    def __init__(self, directory: str, pass_dir: str | None = None, fail_dir: str | None = None,
+                 checkpoint_path: str | None = None, interval: float = 5.0, settle: float = 2.0,
+                 checkpoint_every: int = 100, duplicate_index_path: str | None = None):
+        self.directory = directory
+        self.pass_dir = pass_dir or os.path.join(directory, 'pass')
+        self.fail_dir = fail_dir or os.path.join(directory, 'fail')
+        self.checkpoint = Checkpoint(checkpoint_path or os.path.join(directory, CHECKPOINT_NAME))
+        self.interval = interval
+        self.settle = settle
+        self.checkpoint_every = checkpoint_every
+        self.duplicate_index_path = duplicate_index_path
+        self.duplicate_index = None
+        if duplicate_index_path:
+            from hl7.dedup import open_index
+            self.duplicate_index = open_index(duplicate_index_path)
+        os.makedirs(self.pass_dir, exist_ok=True)
+        os.makedirs(self.fail_dir, exist_ok=True)
+
+    def report_path(self, name: str) -> str:
+        # hidden while in progress so it is never picked up as a new file
+        return os.path.join(self.directory, f".{name}{REPORT_SUFFIX}")
+
+    def pending_files(self) -> list[str]:
+        '''
+        Files ready to be validated, oldest first (hidden files and files still being written are skipped)
+        '''
+        now = time.time()
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.startswith('.') or not entry.is_file():
+                        continue
+                    mtime = entry.stat().st_mtime
+                except OSError: # removed while scanning
+                    continue
+                if now - mtime < self.settle and self.checkpoint.get(entry.name) is None:
+                    continue
+                files.append((mtime, entry.name))
+        return [name for _, name in sorted(files)]
+
+    def process_file(self, name: str) -> bool:
+        '''
+        Validate every message of a file, resuming from the checkpoint if there is one,
+        then move the file and its report to the pass or fail folder
+
+        Returns:
+            bool: True if no message had errors
+        '''
+        path = os.path.join(self.directory, name)
+        report_path = self.report_path(name)
+        state = self.checkpoint.get(name) or {}
+        if 'destination' in state: # crashed while moving, just finish the move
+            self.finish(name, state['destination'], state.get('target'))
+            return state['destination'] == self.pass_dir
+
+        with open(path, 'rb') as f, open(report_path, 'a+', encoding='utf-8', newline='') as report:
+            identity = file_identity(os.fstat(f.fileno()))
+            if state.get('file') != identity: # new file, or a different one under the same name
+                state = {}
+            offset = state.get('offset', 0)
+            index = state.get('index', 0)
+            failed = state.get('failed', False)
+            # drop report lines written after the last checkpoint, they will be written again
+            report.truncate(state.get('report_offset', 0))
+            report.seek(0, os.SEEK_END)
+            f.seek(offset)
+            unsaved = 0
+            for message, offset in iter_messages_with_offsets(f):
+                index += 1
+                try:
+                    errors, warnings = parse_message(message)
+                    if self.duplicate_index is not None:
+                        warnings.extend(self.duplicate_index.check(message))
+                    lines = format_findings(errors, warnings)
+                except Exception as e: # keep going, a broken message must not stop the spool
+                    errors = [str(e)]
+                    lines = [f"Exception: {e}"]
+                failed = failed or bool(errors)
+                report.write(f"Message {index}:\n")
+                report.writelines(f"    {line}\n" for line in lines)
+                unsaved += 1
+                if unsaved >= self.checkpoint_every:
+                    self.save_progress(name, report, offset, index, failed, identity)
+                    unsaved = 0
+            if index == 0:
+                failed = True
+                report.write("Exception: No HL7 message found in file.\n")
+            self.save_progress(name, report, offset, index, failed, identity)
+
+        destination = self.fail_dir if failed else self.pass_dir
+        target = self.free_name(destination, name)
+        self.checkpoint.update(name, destination=destination, target=target)
+        self.finish(name, destination, target)
+        return not failed
+
+    def save_progress(self, name: str, report, offset: int, index: int, failed: bool, identity: list[int]):
+        report.flush()
+        os.fsync(report.fileno())
+        # index first: after a crash in between, messages validated again can at worst be
+        # flagged as possible duplicates of themselves, but no duplicate is ever missed
+        if self.duplicate_index is not None:
+            self.duplicate_index.save(self.duplicate_index_path)
+        self.checkpoint.update(name, offset=offset, index=index, failed=failed, report_offset=report.tell(),
+                               file=identity)
+
+    @staticmethod
+    def free_name(destination: str, name: str) -> str:
+        '''
+        name, or <stem>-<n><ext> if destination already holds a file or report called name
+        '''
+        stem, ext = os.path.splitext(name)
+        target, n = name, 0
+        while (os.path.exists(os.path.join(destination, target))
+               or os.path.exists(os.path.join(destination, target + REPORT_SUFFIX))):
+            n += 1
+            target = f"{stem}-{n}{ext}"
+        return target
+
+    def finish(self, name: str, destination: str, target: str | None = None):
+        '''
+        Move the report and the file to destination (as target, default name) and forget
+        the checkpoint entry. Safe to call again after a crash part way through.
+        '''
+        target = target or name
+        report_path = self.report_path(name)
+        if os.path.exists(report_path):
+            os.replace(report_path, os.path.join(destination, target + REPORT_SUFFIX))
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            os.replace(path, os.path.join(destination, target))
+        self.checkpoint.remove(name)
+
+    def run_once(self) -> int:
+        '''
+        Validate all pending files once
+
+        Returns:
+            int: number of files processed, files that could not be read are not counted
+        '''
+        for name, state in list(self.checkpoint.entries.items()):
+            if 'destination' in state: # crashed after the file was moved
+                self.finish(name, state['destination'], state.get('target'))
+            elif not os.path.exists(os.path.join(self.directory, name)): # removed by hand
+                if os.path.exists(self.report_path(name)):
+                    os.remove(self.report_path(name))
+                self.checkpoint.remove(name)
+        processed = 0
+        for name in self.pending_files():
+            try:
+                self.process_file(name)
+            except OSError as e: # e.g. removed or locked while reading, retried on the next scan
+                print(f"{name}: Exception: {e}", file=sys.stderr)
+                continue
+            processed += 1
+        return processed
+
+    def run_forever(self):
+        '''
+        Keep scanning the directory every interval seconds until interrupted
+        '''
+        while True:
+            if not self.run_once():
+                time.sleep(self.interval)
@@ -0,0 +1,31 @@
+'''
+Code tables used by the segment validators
+
+Every table is a frozenset so it can be shared between threads (and forked
+worker processes) without copying or locking.
+
+'''
+
+# HL7 Table 0001 - Administrative Sex (PID-8)
+ADMINISTRATIVE_SEX = frozenset(['F', 'M', 'O', 'U'])
+
+# Relevant Clinical Information (OBR-13), local values
+RELEVANT_CLINICAL_INFO = frozenset(['Prenatal', 'Not Pregnant', 'Unknown Pregnancy'])
+
+# HL7 Table 0123 - Result Status (OBR-25), restricted to final, preliminary and corrected
+RESULT_STATUS = frozenset(['F', 'P', 'C'])
+
+# HL7 Table 0125 - Value Type (OBX-2), restricted to the types accepted by the receiver
+VALUE_TYPE = frozenset(['SN', 'CWE', 'CNE', 'FT', 'ST', 'TX', 'TS', 'TM', 'DT', 'CE'])
+
+# HL7 Table 0085 - Observation Result Status (OBX-11), restricted to final, preliminary and corrected
+OBSERVATION_RESULT_STATUS = frozenset(['F', 'P', 'C'])
+
+# all tables by name, e.g. for ValidatorEngine.tables
+CODE_TABLES = {
+    'ADMINISTRATIVE_SEX': ADMINISTRATIVE_SEX,
+    'RELEVANT_CLINICAL_INFO': RELEVANT_CLINICAL_INFO,
+    'RESULT_STATUS': RESULT_STATUS,
+    'VALUE_TYPE': VALUE_TYPE,
+    'OBSERVATION_RESULT_STATUS': OBSERVATION_RESULT_STATUS,
+}
@@ -0,0 +1,33 @@
+'''
+Optional compiled build of the hot paths: hl7/_native.py (segment splitting,
+field lookup) and hl7/segments.py (field splitting and checks of each segment).
+
+The package is pure Python and installs as usual. If Cython is installed in
+the build environment, these modules are also compiled to extension modules,
+which Python then imports instead of the .py files. A failed compile (e.g. no C
+compiler) only prints a warning and leaves the pure Python version in place.
+
+    pip install cython
+    pip install --no-build-isolation .
+
+Set HL7_PURE_PYTHON=1 to skip the compiled build.
+
+'''
+import os
+from setuptools import Extension, setup
+
+ext_modules = []
+if not os.environ.get('HL7_PURE_PYTHON'):
+    try:
+        from Cython.Build import cythonize
+    except ImportError:
+        pass
+    else:
+        # named explicitly, hl7 has no __init__.py for cythonize to find the package by
+        ext_modules = cythonize([Extension('hl7._native', ['hl7/_native.py']),
+                                 Extension('hl7.segments', ['hl7/segments.py'])],
+                                compiler_directives={'language_level': 3})
+        for extension in ext_modules:
+            extension.optional = True
+
+setup(ext_modules=ext_modules)
@@ -0,0 +1,66 @@
+from test_engine import VALID_MESSAGE
+import importlib.util
+import io
+import os
+import unittest
+from unittest import mock
+
+def load_app():
+    '''flask/app.py, loaded by path: the flask directory is not a package'''
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'flask', 'app.py')
+    spec = importlib.util.spec_from_file_location('hl7_web_app', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class TestValidateRoute(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.module = load_app()
+
+    def setUp(self):
+        self.app = self.module.app
+        self.client = self.app.test_client()
+
+    def test_findings(self):
+        response = self.client.post('/validate', data=VALID_MESSAGE.encode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'passed': True, 'errors': [], 'warnings': []})
+        response = self.client.post('/validate', data=VALID_MESSAGE.replace('|M||', '|X||').encode())
+        result = response.get_json()
+        self.assertEqual(set(result), {'passed', 'errors', 'warnings'})
+        self.assertFalse(result['passed'])
+        self.assertTrue(result['errors'])
+        # only the findings are returned, never the message
+        self.assertNotIn(b'8675309', response.data)
+
+    def test_content_length_over_limit(self):
+        with mock.patch.dict(self.app.config, {'MAX_CONTENT_LENGTH': 1024}):
+            with mock.patch.object(self.app.config['VALIDATOR_ENGINE'], 'stream') as stream:
+                response = self.client.post('/validate', data=b'x' * 1025)
+        self.assertEqual(response.status_code, 413)
+        stream.assert_not_called() # rejected before reading the body
+
+    def test_chunked_body_over_limit(self):
+        # no Content-Length: the size is only known while reading
+        body = (VALID_MESSAGE * 20).encode()
+        with mock.patch.dict(self.app.config, {'MAX_CONTENT_LENGTH': len(body) - 1}):
+            response = self.client.post('/validate', input_stream=io.BytesIO(body),
+                                        headers={'Transfer-Encoding': 'chunked'},
+                                        environ_overrides={'wsgi.input_terminated': True})
+            self.assertEqual(response.status_code, 413)
+            # a body under the limit is validated (werkzeug rejects one of exactly MAX_CONTENT_LENGTH)
+            response = self.client.post('/validate', input_stream=io.BytesIO(VALID_MESSAGE.encode()),
+                                        headers={'Transfer-Encoding': 'chunked'},
+                                        environ_overrides={'wsgi.input_terminated': True})
+        self.assertEqual(response.get_json()['passed'], True)
+
+    def test_exception(self):
+        with mock.patch.object(self.app.config['VALIDATOR_ENGINE'], 'stream') as stream:
+            stream.return_value.close.side_effect = ValueError("bad message")
+            response = self.client.post('/validate', data=VALID_MESSAGE.encode())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {'exception': 'bad message'})
+
+if __name__ == "__main__":
+    unittest.main()
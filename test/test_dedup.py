@@ -0,0 +1,108 @@
+from hl7.dedup import BloomFilter, DuplicateIndex, PAGE_SIZE
+from unittest import mock
+import hashlib
+import os
+import tempfile
+import unittest
+
+def make_message(control_id, accession, date='20241030100306', sequence='', facility='Test Lab^99999^CLIA'):
+    return (f"MSH|^~\\&|XL2HL7|{facility}|CalRedie|CDPH|{date}||ORU^R01^ORU_R01|{control_id}|P|2.5.1|{sequence}\n"
+            f"PID|1||8675309||Test^Rick^A||20200202|M\n"
+            f"SPM|1|^{accession}&LAB||^Body fluid sample\n")
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f"key{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f"other{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300) # ~1% expected
+
+class TestDuplicateIndex(unittest.TestCase):
+    def test_duplicates(self):
+        index = DuplicateIndex(capacity=1000)
+        self.assertEqual(index.check(make_message('1', 'A1')), [])
+        self.assertEqual(index.check(make_message('2', 'A2')), [])
+        warnings = index.check(make_message('1', 'A2'))
+        self.assertEqual(len(warnings), 2)
+        self.assertTrue(warnings[0].startswith("Possible duplicate Message Control ID (MSH-10): 1,"))
+        self.assertTrue(warnings[1].startswith("Possible duplicate Accession Number (SPM-2-2-1): A2,"))
+        # the same IDs from another facility are not duplicates
+        self.assertEqual(index.check(make_message('1', 'A1', facility='Other Lab^12345^CLIA')), [])
+
+    def test_shared_specimen(self):
+        # one specimen listed in two order groups, and SPM-2-2-1 equal to MSH-10
+        message = make_message('ACC1', 'ACC1') + "SPM|1|^ACC1&LAB||^Body fluid sample\n"
+        index = DuplicateIndex(capacity=1000)
+        self.assertEqual(index.check(message), [])
+        warnings = index.check(message)
+        self.assertEqual(len(warnings), 2)
+        self.assertTrue(warnings[1].startswith("Possible duplicate Accession Number (SPM-2-2-1): ACC1,"))
+
+    def test_window_eviction(self):
+        index = DuplicateIndex(capacity=1000, window=86400, windows=2)
+        index.check(make_message('1', 'A1', date='20240101120000'))
+        self.assertEqual(len(index.check(make_message('1', 'A1', date='20240102120000'))), 2)
+        # two days after it was last seen the key is evicted
+        index.check(make_message('9', 'A9', date='20240103120000'))
+        self.assertEqual(len(index.filters), 2)
+        self.assertEqual(len(index.check(make_message('1', 'A1', date='20240103130000'))), 2)
+        index.check(make_message('8', 'A8', date='20240105120000'))
+        self.assertEqual(index.check(make_message('1', 'A1', date='20240105130000')), [])
+
+    def test_sequence_gaps(self):
+        index = DuplicateIndex(capacity=1000)
+        self.assertEqual(index.check(make_message('1', 'A1', sequence='7')), [])
+        self.assertEqual(index.check(make_message('2', 'A2', sequence='8')), [])
+        self.assertEqual(index.check(make_message('3', 'A3', sequence='11')),
+                         ["Gap in Sequence Number (MSH-13): 2 message(s) missing between 8 and 11 from Test Lab^99999^CLIA."])
+        self.assertTrue(index.check(make_message('4', 'A4', sequence='10'))[0].startswith("Out of order Sequence Number"))
+
+    def test_save_and_load(self):
+        index = DuplicateIndex(capacity=1000)
+        index.check(make_message('1', 'A1', sequence='1'))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index')
+            index.save(path)
+            loaded = DuplicateIndex.load(path)
+            self.assertEqual(len(loaded.check(make_message('1', 'A1', sequence='2'))), 2)
+            self.assertEqual(loaded.sequences, {'Test Lab^99999^CLIA': 2})
+            del loaded
+
+    def test_incremental_save(self):
+        index = DuplicateIndex(capacity=100_000, window=86400, windows=2)
+        index.check(make_message('1', 'A1', date='20240101120000'))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index')
+            index.save(path)
+            loaded = DuplicateIndex.load(path)
+            (bloom,) = loaded.filters.values()
+            self.assertEqual(bloom.dirty, set())
+            loaded.check(make_message('2', 'A2', date='20240101130000'))
+            # two keys touch a handful of pages, not the whole window
+            self.assertLessEqual(len(bloom.dirty), 2 * bloom.hash_count)
+            self.assertLess(len(bloom.dirty) * PAGE_SIZE, len(bloom.bits))
+            with mock.patch('hl7.dedup.os.replace', wraps=os.replace) as replace:
+                loaded.save(path)
+            self.assertEqual(replace.call_count, 1) # only index.json, the window file is patched in place
+            reloaded = DuplicateIndex.load(path)
+            self.assertEqual(len(reloaded.check(make_message('2', 'A2', date='20240101140000'))), 2)
+            self.assertEqual(len(reloaded.check(make_message('1', 'A1', date='20240101140000'))), 2)
+            # evicted windows are removed from the directory
+            reloaded.check(make_message('3', 'A3', date='20240110120000'))
+            reloaded.save(path)
+            self.assertEqual(sorted(os.listdir(path)), ['index.json', 'window-19732.bits'])
+            del loaded, bloom, reloaded
+
+    def test_positions_hashed_once(self):
+        index = DuplicateIndex(capacity=1000, windows=5)
+        for day in range(1, 6):
+            index.check(make_message(str(day), f"A{day}", date=f"2024010{day}120000"))
+        with mock.patch('hl7.dedup.hashlib.blake2b', wraps=hashlib.blake2b) as blake2b:
+            index.seen('key', index.window * 19727)
+        self.assertEqual(blake2b.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+from hl7.parser import ValidatorEngine, default_engine, parse_message, segment_message
+from hl7.tables import CODE_TABLES
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+VALID_MESSAGE = r'''MSH|^~\&|XL2HL7^1.10.100.1.111111.1.101^ISO|Test Lab^99999^CLIA|CalRedie|CDPH|20241030100306||ORU^R01^ORU_R01|103|P|2.5.1|||NE|NE|||||PHLabReport-NoAck^^^ISO
+SFT|XL2HL7 Conversion|1.0|CalREDIE XC|1.0||20240105
+PID|1||8675309||Test^Rick^A||20200202|M||2033-9|1234 Main Ln.^^Sacramento^CA^95814||^PRN^PH^^1^916^1234567|||||||||H|
+ORC|RE|Gon1001^Test Lab^99999^CLIA|Doctor|||||||||NPI123456^Doctor^Doctor|||||||||Test Lab^^^^^^^^^99999|123 That Street St.^^Sacramento^CA^95814^^B|^WPN^PH^^^337^3373377|123 That Street St.^^Sacramento^CA^95814|||||||
+OBR|1|Gon1001^Test Lab^99999^CLIA|Gon1001|21416-3N. gonorrhoeae DNA NAA+probe Ql (U)|||24y0229092624||||||Not Pregnant|||NPI123456^Doctor^Doctor|^WPN^PH^^1^337^3373377|||||20241030100306|||F|||||||||||||||||||||||||
+OBX|1|CE|21416-3^N. gonorrhoeae DNA NAA+probe Ql (U)||260373001^Detected||NEG|A^Abnormal|||F|||20240228101533|||^Roche cobas 8800 System||20240229092624||||ARUP^^^^^^^^^46D0523979|2023 Floyd Ave^Salt Lake City^UT^84108||||||
+SPM|1|^8675309|| ^Body fluid sample|||||||||||||20240228101533|20240228110000|||||||||||
+'''
+
+class TestValidatorEngine(unittest.TestCase):
+    def test_default_engine_is_shared(self):
+        self.assertIs(default_engine(), default_engine())
+
+    def test_read_only_state(self):
+        engine = ValidatorEngine()
+        with self.assertRaises(TypeError):
+            engine.validators['ZZZ'] = object
+        with self.assertRaises(TypeError):
+            engine.tables['ADMINISTRATIVE_SEX'] = frozenset()
+
+    def test_tables(self):
+        message = VALID_MESSAGE.replace('|M||', '|X||')
+        self.assertEqual(ValidatorEngine().validate(message)[0],
+                         ["Invalid Patient Sex: X, should be either F, M, O, or U."])
+        engine = ValidatorEngine(tables={**CODE_TABLES, 'ADMINISTRATIVE_SEX': frozenset(['F', 'M', 'O', 'U', 'X'])})
+        self.assertEqual(engine.validate(message), [[], []])
+        stream = engine.stream()
+        stream.feed(message)
+        self.assertEqual(stream.close(), [[], []])
+
+    def test_shared_between_threads(self):
+        engine = ValidatorEngine()
+        messages = [VALID_MESSAGE,
+                    VALID_MESSAGE.replace('|M||', '|X||'),
+                    VALID_MESSAGE.replace('|F|||20240228101533', '|Z|||20240228101533'),
+                    "MSH|^~\\&|only a header"] * 50
+        expected = [parse_message(message) for message in messages]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(engine.validate, messages))
+        self.assertEqual(results, expected)
+        self.assertEqual(expected[0], [[], []])
+        self.assertEqual(expected[1][0], ["Invalid Patient Sex: X, should be either F, M, O, or U."])
+
+    def test_blank_lines(self):
+        engine = ValidatorEngine()
+        messages = [VALID_MESSAGE.replace('\nPID', '\n\nPID'),
+                    VALID_MESSAGE.replace('\nPID', '\n  \t\r\nPID'),
+                    VALID_MESSAGE + ' ',
+                    VALID_MESSAGE + '\n \n\r\n']
+        for message in messages:
+            self.assertEqual(engine.validate(message), [[], []], repr(message))
+            stream = engine.stream()
+            stream.feed(message)
+            self.assertEqual(stream.close(), [[], []], repr(message))
+        segment_list, segment_name_list = segment_message(messages[1])
+        self.assertEqual(segment_name_list, ['MSH', 'SFT', 'PID', 'ORC', 'OBR', 'OBX', 'SPM'])
+        # empty names are ignored, other names must still have 3 characters
+        self.assertTrue(engine.check_segments(['MSH', 'SFT', '', 'PID', 'ORC', 'OBR', 'OBX', 'SPM', '']))
+        self.assertIsNotNone(engine.parse_structure(['MSH', 'SFT', '', 'PID', 'ORC', 'OBR', 'OBX', 'SPM', '']))
+        self.assertFalse(engine.check_segments(['MS', 'HSFT', 'PID', 'ORC', 'OBR', 'OBX', 'SPM']))
+
+    def test_stream_matches_validate(self):
+        engine = ValidatorEngine()
+        messages = [VALID_MESSAGE,
+                    VALID_MESSAGE.replace('\n', '\r\n'),
+                    '\r\n\n' + VALID_MESSAGE + '\n\r\n',
+                    VALID_MESSAGE.replace('\nPID', '\n\nPID'), # blank line inside the message
+                    VALID_MESSAGE + ' ',
+                    VALID_MESSAGE.replace('|M||', '|X||'),
+                    "MSH|^~\\&|only a header",
+                    ""]
+        for message in messages:
+            expected = engine.validate(message)
+            for chunk_size in [1, 7, 64, len(message) + 1]:
+                stream = engine.stream()
+                for start in range(0, len(message), chunk_size):
+                    stream.feed(message[start:start + chunk_size])
+                self.assertEqual(stream.close(), expected, (message, chunk_size))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+from hl7.export import parse_path, get_value, ColumnExtractor, export_columns, has_pyarrow, output_format
+from hl7.parser import iter_messages, parse_structure, segment_message
+import csv
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+MESSAGE = r'''MSH|^~\&|XL2HL7^1.10.100.1.111111.1.101^ISO|Test Lab^99999^CLIA|CalRedie|CDPH|20241030100306||ORU^R01^ORU_R01|103|P|2.5.1
+PID|1||8675309||Test^Rick^A||20200202|M||2033-9
+OBX|1|CE|21416-3^N. gonorrhoeae DNA NAA+probe Ql (U)||260373001^Detected||NEG|A^Abnormal|||F||||||||20240229092624
+OBX|2|CE|12345-6^Second test||OTHER^Other
+SPM|1|^8675309&ACC||^Body fluid sample|||||||||||||20240228101533|20240228110000
+'''
+
+TWO_ORDERS = r'''MSH|^~\&|Lab^1^CLIA|Lab^1^CLIA|CalRedie|CDPH|20240101120000||ORU^R01^ORU_R01|104|P|2.5.1
+SFT|XL2HL7 Conversion|1.0|CalREDIE XC|1.0||20240105
+PID|1||8675309||Test^Rick^A||20200202|M
+ORC|RE|A
+OBR|1|A
+OBX|1|CE|111-1^First test||260373001^Detected
+SPM|1|^ACC1||^Body fluid sample|||||||||||||20240101000000
+ORC|RE|B
+OBR|2|B
+OBX|1|CE|222-2^Second test||260373001^Detected
+SPM|1|^ACC2||^Body fluid sample|||||||||||||20240202000000
+'''
+
+class TestExport(unittest.TestCase):
+    def test_parse_path(self):
+        self.assertEqual(parse_path('PID-7'), ('PID', 7, 0, 0))
+        self.assertEqual(parse_path('spm-2-2-1'), ('SPM', 2, 2, 1))
+        for path in ['PID', 'PID-x', 'PID-0', 'PIDX-1', 'SPM-1-2-3-4']:
+            with self.assertRaises(ValueError):
+                parse_path(path)
+
+    def test_get_value_msh_offset(self):
+        msh = MESSAGE.splitlines()[0]
+        self.assertEqual(get_value(msh, 1), '|')
+        self.assertEqual(get_value(msh, 2), '^~\\&')
+        self.assertEqual(get_value(msh, 10), '103')
+        self.assertEqual(get_value(msh, 9, 3), 'ORU_R01')
+        self.assertIsNone(get_value(msh, 40))
+
+    def test_columns(self):
+        extractor = ColumnExtractor(['PID-7', 'PID-8', 'OBX-3-1', 'OBX-5-2', 'OBX-19', 'SPM-2-2-2', 'SPM-17', 'NTE-3'])
+        extractor.extend([MESSAGE, MESSAGE.replace('|M|', '||')])
+        # one row per OBX, message level columns repeated
+        self.assertEqual(len(extractor), 4)
+        columns = extractor.to_dict()
+        self.assertEqual(columns['PID-7'], ['20200202'] * 4)
+        self.assertEqual(columns['PID-8'], ['M', 'M', None, None])
+        self.assertEqual(columns['OBX-3-1'], ['21416-3', '12345-6'] * 2)
+        self.assertEqual(columns['OBX-5-2'], ['Detected', 'Other'] * 2)
+        self.assertEqual(columns['OBX-19'], ['20240229092624', None] * 2)
+        self.assertEqual(columns['SPM-2-2-2'], ['ACC'] * 4)
+        self.assertEqual(columns['SPM-17'], ['20240228101533'] * 4)
+        self.assertEqual(columns['NTE-3'], [None] * 4)
+
+    def test_order_group_columns(self):
+        # order group columns come from the group holding the OBX
+        self.assertIsNotNone(parse_structure(segment_message(TWO_ORDERS)[1]))
+        extractor = ColumnExtractor(['MSH-10', 'OBR-2', 'OBX-3-1', 'SPM-2-2', 'SPM-17'])
+        extractor.add(TWO_ORDERS)
+        self.assertEqual(extractor.to_dict(), {'MSH-10': ['104', '104'],
+                                               'OBR-2': ['A', 'B'],
+                                               'OBX-3-1': ['111-1', '222-2'],
+                                               'SPM-2-2': ['ACC1', 'ACC2'],
+                                               'SPM-17': ['20240101000000', '20240202000000']})
+
+    def test_row_segment(self):
+        # without OBX paths, or with row_segment='', each message is one row
+        extractor = ColumnExtractor(['PID-7', 'SPM-17'])
+        extractor.extend([MESSAGE, MESSAGE])
+        self.assertEqual(extractor.to_dict()['SPM-17'], ['20240228101533'] * 2)
+        extractor = ColumnExtractor(['PID-7', 'OBX-3-1'], row_segment='')
+        extractor.add(MESSAGE)
+        self.assertEqual(extractor.to_dict(), {'PID-7': ['20200202'], 'OBX-3-1': ['21416-3']})
+        # a message without the row segment still gets a row
+        extractor = ColumnExtractor(['PID-7', 'OBX-3-1'])
+        extractor.add('\n'.join(line for line in MESSAGE.splitlines() if not line.startswith('OBX')))
+        self.assertEqual(extractor.to_dict(), {'PID-7': ['20200202'], 'OBX-3-1': [None]})
+
+    def test_leading_blank_lines(self):
+        lines = ('\r\n\n' + MESSAGE * 2).splitlines(keepends=True)
+        self.assertEqual(list(iter_messages(lines)), [MESSAGE] * 2)
+
+    def test_export_csv_in_batches(self):
+        lines = (MESSAGE * 5).splitlines(keepends=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            output_path = os.path.join(tmp, 'out.csv')
+            rows = export_columns(iter_messages(lines), ['MSH-10', 'PID-8'], output_path, format='csv', batch_size=2)
+            self.assertEqual(rows, 5)
+            with open(output_path, newline='') as f:
+                table = list(csv.reader(f))
+        self.assertEqual(table[0], ['MSH-10', 'PID-8'])
+        self.assertEqual(table[1:], [['103', 'M']] * 5)
+
+    def test_output_format(self):
+        self.assertEqual(output_format('out.csv'), 'csv')
+        self.assertEqual(output_format('OUT.CSV'), 'csv')
+        self.assertEqual(output_format('out.parquet'), 'parquet')
+        with mock.patch('hl7.export.has_pyarrow', return_value=True):
+            self.assertEqual(output_format('out.csv'), 'csv')
+            self.assertEqual(output_format('out.data'), 'parquet')
+        with mock.patch('hl7.export.has_pyarrow', return_value=False):
+            self.assertEqual(output_format('out.data'), 'csv')
+        with tempfile.TemporaryDirectory() as tmp:
+            output_path = os.path.join(tmp, 'out.csv')
+            export_columns([MESSAGE], ['MSH-10'], output_path)
+            with open(output_path, newline='') as f:
+                self.assertEqual(list(csv.reader(f)), [['MSH-10'], ['103']])
+
+    @unittest.skipUnless(has_pyarrow(), "pyarrow is not installed")
+    def test_export_parquet(self):
+        import pyarrow.parquet as pq
+        with tempfile.TemporaryDirectory() as tmp:
+            output_path = os.path.join(tmp, 'out.parquet')
+            rows = export_columns([MESSAGE] * 3, ['PID-7', 'ZZZ-1'], output_path, format='parquet', batch_size=2)
+            self.assertEqual(rows, 3)
+            table = pq.read_table(output_path).to_pydict()
+        self.assertEqual(table, {'PID-7': ['20200202'] * 3, 'ZZZ-1': [None] * 3})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+'''
+Randomized and adversarial tests for the parser and the segment validators.
+
+Every random test uses a fixed seed so failures can be reproduced. Time
+bounds compare run times of the same input shape at two sizes, which
+catches super-linear behaviour (e.g. regex backtracking) without depending
+on how fast the machine is.
+
+'''
+from hl7.parser import (REQUIRED_SEGMENTS, UNBOUND, SEGMENT_VALIDATORS, ValidatorEngine,
+                        check_segments, parse_structure, segment_message, parse_message)
+import random
+import time
+import unittest
+
+SEED = 20241030
+SEGMENT_NAMES = ['MSH', 'SFT', 'PID', 'PD1', 'NTE', 'NK1', 'PV1', 'PV2', 'ORC', 'OBR', 'TQ1', 'TQ2',
+                 'CTD', 'OBX', 'FT1', 'CTI', 'SPM', 'ZZZ']
+DELIMITERS = '|^~\\&'
+
+def reference_match(segment_names, required_segments=REQUIRED_SEGMENTS):
+    '''
+    Independent, slow matcher for REQUIRED_SEGMENTS: tracks every position the
+    segment list could be at after each element, so it has no backtracking to get wrong
+    '''
+    def repeat(step, min_count, max_count, positions):
+        result = set(positions) if min_count == 0 else set()
+        current, seen, count = set(positions), set(), 0
+        while current and (max_count == UNBOUND or count < max_count):
+            current = step(current)
+            count += 1
+            if count >= min_count:
+                if current <= seen:
+                    break
+                result |= current
+            seen |= current
+        return result
+
+    def element(item, positions):
+        if isinstance(item[0], tuple):
+            group, min_count, max_count = item
+            return repeat(lambda p: sequence(group, p), min_count, max_count, positions)
+        name, min_count, max_count = item
+        step = lambda p: {i + 1 for i in p if i < len(segment_names) and segment_names[i] == name}
+        return repeat(step, min_count, max_count, positions)
+
+    def sequence(items, positions):
+        for item in items:
+            positions = element(item, positions)
+        return positions
+
+    return len(segment_names) in sequence(required_segments, {0})
+
+def generate(rng, required_segments=REQUIRED_SEGMENTS, max_repeat=3):
+    '''
+    Random segment name list that follows required_segments
+    '''
+    names = []
+    for item in required_segments:
+        min_count, max_count = item[1], item[2]
+        upper = min_count + max_repeat if max_count == UNBOUND else max_count
+        for _ in range(rng.randint(min_count, upper)):
+            if isinstance(item[0], tuple):
+                names.extend(generate(rng, item[0], max_repeat))
+            else:
+                names.append(item[0])
+    return names
+
+def mutate(rng, names):
+    names = list(names)
+    for _ in range(rng.randint(1, 3)):
+        action = rng.choice(['insert', 'delete', 'replace', 'swap'])
+        position = rng.randrange(len(names) + 1)
+        if action == 'insert' or not names:
+            names.insert(position, rng.choice(SEGMENT_NAMES))
+        elif action == 'delete':
+            del names[min(position, len(names) - 1)]
+        elif action == 'replace':
+            names[min(position, len(names) - 1)] = rng.choice(SEGMENT_NAMES)
+        else:
+            i, j = rng.randrange(len(names)), rng.randrange(len(names))
+            names[i], names[j] = names[j], names[i]
+    return names
+
+def random_field(rng, max_length=40):
+    alphabet = 'ABCxyz019 .-' + DELIMITERS
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+def random_segment(rng, name):
+    return name + '|' + '|'.join(random_field(rng) for _ in range(rng.randint(0, 30)))
+
+def best_time(function, argument, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+class TestStructureFuzz(unittest.TestCase):
+    def test_generated_messages_pass(self):
+        rng = random.Random(SEED)
+        for _ in range(500):
+            names = generate(rng)
+            self.assertTrue(check_segments(names), names)
+            self.assertEqual(parse_structure(names).indices(), list(range(len(names))))
+
+    def test_mutations_match_reference(self):
+        rng = random.Random(SEED + 1)
+        for _ in range(2000):
+            names = mutate(rng, generate(rng))
+            self.assertEqual(check_segments(names), reference_match(names), names)
+            self.assertEqual(parse_structure(names) is not None, reference_match(names), names)
+
+    def test_random_sequences_match_reference(self):
+        rng = random.Random(SEED + 2)
+        for _ in range(2000):
+            names = [rng.choice(SEGMENT_NAMES) for _ in range(rng.randint(0, 15))]
+            self.assertEqual(check_segments(names), reference_match(names), names)
+            self.assertEqual(parse_structure(names) is not None, reference_match(names), names)
+
+    def test_names_are_not_merged(self):
+        self.assertFalse(check_segments(['MSHSFT', 'PID', 'ORC', 'OBR', 'OBX', 'SPM']))
+        self.assertFalse(check_segments(['MS', 'HSFT', 'PID', 'ORC', 'OBR', 'OBX', 'SPM']))
+
+class TestValidatorFuzz(unittest.TestCase):
+    def assert_findings(self, output):
+        self.assertEqual(len(output), 2)
+        for findings in output:
+            self.assertIsInstance(findings, list)
+            self.assertTrue(all(isinstance(finding, str) for finding in findings))
+
+    def test_validators_never_raise(self):
+        rng = random.Random(SEED + 3)
+        for name, validator in SEGMENT_VALIDATORS.items():
+            for _ in range(300):
+                self.assert_findings(validator(random_segment(rng, name)).validate())
+            # degenerate segments
+            for text in [name, name + '|', name + '|' * 40, name + '|' + '^' * 40, name + '|' + DELIMITERS * 20]:
+                self.assert_findings(validator(text).validate())
+
+    def test_segment_message(self):
+        rng = random.Random(SEED + 4)
+        for _ in range(300):
+            names = [rng.choice(SEGMENT_NAMES) for _ in range(rng.randint(1, 20))]
+            message = '\r\n'.join(random_segment(rng, name) for name in names)
+            segment_list, segment_name_list = segment_message(message)
+            self.assertEqual(segment_name_list, names)
+            self.assertEqual(len(segment_list), len(names))
+            self.assertTrue(all('\r' not in segment for segment in segment_list))
+
+    def test_stream_matches_validate(self):
+        rng = random.Random(SEED + 5)
+        engine = ValidatorEngine()
+        for _ in range(100):
+            names = generate(rng) if rng.random() < 0.7 else mutate(rng, generate(rng))
+            message = '\n'.join(random_segment(rng, name) for name in names)
+            stream = engine.stream()
+            position = 0
+            while position < len(message):
+                size = rng.randint(1, 50)
+                stream.feed(message[position:position + size])
+                position += size
+            self.assertEqual(stream.close(), engine.validate(message))
+
+class TestWorstCase(unittest.TestCase):
+    # run time may grow by at most this factor over linear between the two sizes
+    SLACK = 3
+    SMALL, LARGE = 2000, 16000
+
+    def assert_linear(self, function, make_input):
+        small = best_time(function, make_input(self.SMALL))
+        large = best_time(function, make_input(self.LARGE))
+        limit = (self.LARGE / self.SMALL) * self.SLACK * max(small, 1e-4)
+        self.assertLess(large, limit, f"{small:.4f}s for {self.SMALL} vs {large:.4f}s for {self.LARGE}")
+
+    def test_structure_scaling(self):
+        head = ['MSH', 'SFT', 'PID', 'ORC', 'OBR']
+        shapes = {
+            'many OBX, no SPM': lambda n: head + ['OBX'] * n,
+            'many OBX, junk at the end': lambda n: head + ['OBX'] * n + ['SPM', 'ZZZ'],
+            'OBX/NTE repetitions': lambda n: head + ['OBX', 'NTE'] * (n // 2) + ['SPM'],
+            'many order groups, junk at the end': lambda n: head + ['OBX', 'SPM', 'OBR'] * (n // 3) + ['ZZZ'],
+            'SPM/OBX repetitions, missing OBR': lambda n: head + ['OBX'] + ['SPM', 'OBX', 'OBX'] * (n // 3) + ['OBX'],
+            'many NTE': lambda n: ['MSH', 'SFT', 'PID'] + ['NTE'] * n + ['ORC', 'OBR', 'OBX'],
+        }
+        for shape, make_input in shapes.items():
+            with self.subTest(shape=shape):
+                self.assert_linear(check_segments, make_input)
+                self.assert_linear(parse_structure, make_input)
+
+    def test_long_fields_scaling(self):
+        def make_message(n):
+            obx = 'OBX|1|ED|21416-3^Test||' + 'A^B&C~' * n + '|||||F'
+            return '\n'.join(['MSH|^~\\&|x|Lab^1|r|f|20241030100306||ORU|1|P|2.5.1', 'SFT|a|1|b',
+                              'PID|1||1||A^B||20200202|M', 'ORC|RE', 'OBR|1', obx, 'SPM|1|^1'])
+        self.assert_linear(parse_message, make_message)
+
+    def test_many_segments_scaling(self):
+        obx = 'OBX|1|CE|21416-3^Test||260373001^Detected||NEG|A|||F||||||||20240229092624||||ARUP^^^^^^^^^46D|Addr'
+        def make_message(n):
+            return '\n'.join(['MSH|^~\\&|x|Lab^1|r|f|20241030100306||ORU|1|P|2.5.1', 'SFT|a|1|b',
+                              'PID|1||1||A^B||20200202|M', 'ORC|RE', 'OBR|1']
+                             + [obx, 'NTE|1||note'] * (n // 2) + ['SPM|1|^1'])
+        self.assert_linear(parse_message, make_message)
+
+if __name__ == "__main__":
+    unittest.main()
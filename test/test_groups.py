@@ -0,0 +1,65 @@
+from hl7.parser import ValidatorEngine, parse_structure
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest import mock
+import unittest
+
+HEADER = r'''MSH|^~\&|XL2HL7^1.10.100.1.111111.1.101^ISO|Test Lab^99999^CLIA|CalRedie|CDPH|20241030100306||ORU^R01^ORU_R01|103|P|2.5.1|||NE|NE|||||PHLabReport-NoAck^^^ISO
+SFT|XL2HL7 Conversion|1.0|CalREDIE XC|1.0||20240105
+PID|1||8675309||Test^Rick^A||20200202|M||2033-9|1234 Main Ln.^^Sacramento^CA^95814||^PRN^PH^^1^916^1234567|||||||||H|
+ORC|RE|Gon1001^Test Lab^99999^CLIA|Doctor|||||||||NPI123456^Doctor^Doctor|||||||||Test Lab^^^^^^^^^99999|123 That Street St.^^Sacramento^CA^95814^^B|^WPN^PH^^^337^3373377|123 That Street St.^^Sacramento^CA^95814|||||||
+'''
+OBR = "OBR|1|Gon1001^Test Lab^99999^CLIA|Gon1001|21416-3N. gonorrhoeae DNA NAA+probe Ql (U)|||24y0229092624||||||Not Pregnant|||NPI123456^Doctor^Doctor|^WPN^PH^^1^337^3373377|||||20241030100306|||F|||||||||||||||||||||||||\n"
+OBX = "OBX|1|{data_type}|21416-3^N. gonorrhoeae DNA NAA+probe Ql (U)||260373001^Detected||NEG|A^Abnormal|||F|||20240228101533|||^Roche cobas 8800 System||{resulted}||||ARUP^^^^^^^^^46D0523979|2023 Floyd Ave^Salt Lake City^UT^84108||||||\n"
+SPM = "SPM|1|^8675309|| ^Body fluid sample|||||||||||||20240228101533|20240228110000|||||||||||\n"
+
+def make_message(orders):
+    '''orders: list of [(data_type, resulted)] per order group'''
+    message = HEADER
+    for observations in orders:
+        message += OBR + ''.join(OBX.format(data_type=d, resulted=r) for d, r in observations) + SPM
+    return message
+
+class TestGroups(unittest.TestCase):
+    def test_tree(self):
+        names = ['MSH', 'SFT', 'PID', 'ORC', 'OBR', 'OBX', 'NTE', 'SPM', 'OBX', 'OBR', 'OBX', 'SPM']
+        others, orders = parse_structure(names).split_orders()
+        self.assertEqual(others, [0, 1, 2])
+        self.assertEqual(orders, [[3, 4, 5, 6, 7, 8], [9, 10, 11]])
+        self.assertIsNone(parse_structure(names[:-1]))
+
+    def test_group_rules(self):
+        engine = ValidatorEngine()
+        self.assertEqual(engine.validate(make_message([[('CE', '20240229092624')]])), [[], []])
+        errors, warnings = engine.validate(make_message([[('CE', '20240227000000')]]))
+        self.assertEqual(errors, ["Invalid Test Resulted Date and Time (OBX-19): 20240227000000, is before Specimen Collected Date and Time (SPM-17): 20240228101533."])
+        errors, warnings = engine.validate(make_message([[('CE', '20240229092624'), ('CWE', '20240229092624')]]))
+        self.assertEqual(warnings, ["Inconsistent Data Type (OBX-2) for Lab Test LOINC code (OBX-3-1) 21416-3: CE and CWE."])
+        # rules apply within a group, not across groups
+        self.assertEqual(engine.validate(make_message([[('CE', '20240229092624')], [('CWE', '20240229092624')]])), [[], []])
+
+    def test_parallel_matches_serial(self):
+        engine = ValidatorEngine()
+        orders = [[('CE', '20240229092624'), ('XX', '2024')] if i % 3 else [('CE', '20240101000000')] for i in range(30)]
+        message = make_message(orders).replace('|M||', '|X||')
+        expected = engine.validate(message)
+        self.assertTrue(expected[0])
+        # small messages are validated serially, the executor is not even used
+        executor = mock.Mock(spec=ThreadPoolExecutor)
+        self.assertEqual(engine.validate(message, executor), expected)
+        executor.map.assert_not_called()
+        with mock.patch('hl7.parser.PARALLEL_MIN_GROUPS', 10):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                self.assertEqual(engine.validate(message, executor), expected)
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                self.assertEqual(engine.validate(message, executor), expected)
+
+    def test_stream_matches_validate(self):
+        engine = ValidatorEngine()
+        message = make_message([[('CE', '20240227000000'), ('CWE', '20240229092624')], [('CE', '20240229092624')]])
+        stream = engine.stream()
+        for start in range(0, len(message), 13):
+            stream.feed(message[start:start + 13])
+        self.assertEqual(stream.close(), engine.validate(message))
+
+if __name__ == "__main__":
+    unittest.main()
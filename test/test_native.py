@@ -0,0 +1,57 @@
+from hl7 import _native, segments
+import importlib.util
+import os
+import random
+import unittest
+
+def load_pure(name='_native'):
+    '''the pure Python source of an hl7 module, even when the compiled module is installed'''
+    path = os.path.join(os.path.dirname(_native.__file__), f'{name}.py')
+    spec = importlib.util.spec_from_file_location(f'hl7_{name}_pure', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def reference_split(message, sep='\n'):
+    '''segment_message written the straightforward way, blank lines dropped'''
+    segment_list = message.strip('\n\r').split(sep)
+    segment_list = [segment.strip('\r') for segment in segment_list]
+    segment_list = [segment for segment in segment_list if segment.strip()]
+    segment_name_list = [segment.split('|')[0].strip() for segment in segment_list]
+    return segment_list, segment_name_list
+
+class TestNative(unittest.TestCase):
+    def setUp(self):
+        self.pure = load_pure()
+        rng = random.Random(20241030)
+        alphabet = 'ABC019 .-|^~\\&\r\n'
+        self.messages = ['', '\n', '\r\n\r\n', 'MSH', ' MSH |x', 'MSH|^~\\&|a\r\nPID|1\r\n']
+        self.messages += [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 200))) for _ in range(500)]
+
+    def test_pure_module(self):
+        self.assertFalse(self.pure.COMPILED)
+
+    def test_split_segments(self):
+        for message in self.messages:
+            for sep in ['\n', '\r']:
+                expected = reference_split(message, sep)
+                self.assertEqual(self.pure.split_segments(message, sep), expected)
+                self.assertEqual(_native.split_segments(message, sep), expected)
+
+    def test_get_value(self):
+        for message in self.messages:
+            for segment in message.split('\n'):
+                for path in [(0, 0, 0), (1, 0, 0), (2, 0, 0), (3, 1, 0), (3, 2, 1), (9, 3, 0), (25, 1, 1)]:
+                    self.assertEqual(_native.get_value(segment, *path), self.pure.get_value(segment, *path))
+                    self.assertEqual(_native.get_value('MSH' + segment, *path), self.pure.get_value('MSH' + segment, *path))
+
+    def test_segments(self):
+        pure = load_pure('segments')
+        for message in self.messages:
+            for segment in message.split('\n'):
+                for name in ['MSH', 'SFT', 'PID', 'ORC', 'OBR', 'OBX', 'SPM']:
+                    text = name + segment
+                    self.assertEqual(getattr(segments, name)(text).validate(), getattr(pure, name)(text).validate())
+
+if __name__ == "__main__":
+    unittest.main()
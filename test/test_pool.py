@@ -0,0 +1,111 @@
+from hl7.parser import ValidatorEngine
+from hl7.pool import ValidatorPool, WorkerCrashed
+from test_engine import VALID_MESSAGE
+import os
+import pickle
+import time
+import unittest
+from unittest import mock
+
+class MisbehavingEngine(ValidatorEngine):
+    '''
+    Engine that crashes its process on "CRASH" and hangs on "HANG"
+    '''
+    def validate(self, message, executor=None):
+        if message == 'CRASH':
+            os._exit(3)
+        if message == 'HANG':
+            time.sleep(60)
+        if message == 'RAISE':
+            raise ValueError("bad message")
+        return super().validate(message, executor)
+
+class TestValidatorPool(unittest.TestCase):
+    def setUp(self):
+        self.engine = MisbehavingEngine()
+        self.pool = ValidatorPool(2, timeout=1, engine=self.engine)
+        self.addCleanup(self.pool.close)
+
+    def test_matches_engine(self):
+        messages = [VALID_MESSAGE,
+                    VALID_MESSAGE.replace('|M||', '|X||'),
+                    "MSH|^~\\&|only a header",
+                    ""] * 10
+        futures = [self.pool.submit(message) for message in messages]
+        self.assertEqual([future.result(10) for future in futures],
+                         [self.engine.validate(message) for message in messages])
+
+    def test_workers_are_reused(self):
+        pids = {worker.process.pid for worker in self.pool.workers}
+        for _ in range(20):
+            self.pool.validate(VALID_MESSAGE)
+        self.assertEqual({worker.process.pid for worker in self.pool.workers}, pids)
+        self.assertEqual(self.pool.restarts, 0)
+
+    def test_exception_in_worker(self):
+        with self.assertRaisesRegex(RuntimeError, "ValueError: bad message"):
+            self.pool.submit('RAISE').result(10)
+        self.assertEqual(self.pool.restarts, 0)
+
+    def test_crashed_worker_is_replaced(self):
+        with self.assertRaises(WorkerCrashed):
+            self.pool.submit('CRASH').result(10)
+        self.assertEqual(self.pool.restarts, 1)
+        self.assertEqual(self.pool.submit(VALID_MESSAGE).result(10), [[], []])
+        self.assertTrue(all(worker.process.is_alive() for worker in self.pool.workers))
+
+    def test_slow_worker_is_replaced(self):
+        hanging = self.pool.submit('HANG')
+        # the other worker keeps serving while one is stuck
+        self.assertEqual(self.pool.submit(VALID_MESSAGE).result(10), [[], []])
+        with self.assertRaises(TimeoutError):
+            hanging.result(10)
+        self.assertEqual(self.pool.restarts, 1)
+        self.assertEqual(self.pool.submit(VALID_MESSAGE).result(10), [[], []])
+
+    def test_dead_idle_worker_is_replaced(self):
+        # the worker died while idle: sending it the message fails, the message goes to a new worker
+        worker = self.pool.workers[0]
+        with self.pool.lock: # keep the supervisor from dispatching until the pipe is broken
+            worker.connection.send = mock.Mock(side_effect=BrokenPipeError(32, 'Broken pipe'))
+        self.assertEqual(self.pool.submit(VALID_MESSAGE).result(10), [[], []])
+        self.assertEqual(self.pool.restarts, 1)
+        self.assertIsNot(self.pool.workers[0], worker)
+
+    def test_supervisor_failure_fails_every_caller(self):
+        # both workers time out, and no new worker can be started
+        with mock.patch.object(self.pool, 'restart', side_effect=OSError(24, 'Too many open files')):
+            hanging = [self.pool.submit('HANG') for _ in range(2)]
+            queued = [self.pool.submit(VALID_MESSAGE) for _ in range(3)]
+            for future in hanging + queued:
+                with self.assertRaisesRegex(RuntimeError, "ValidatorPool stopped: OSError"):
+                    future.result(10)
+        with self.assertRaises(RuntimeError):
+            self.pool.submit(VALID_MESSAGE)
+
+    def test_validate_wait_is_bounded(self):
+        pool = ValidatorPool(1, timeout=None, engine=self.engine)
+        self.addCleanup(pool.close)
+        pool.submit('HANG')
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            pool.validate(VALID_MESSAGE, timeout=0.5)
+        self.assertLess(time.monotonic() - start, 5)
+        # with the pool's timeout, the default wait covers the queue
+        with self.assertRaises(TimeoutError):
+            self.pool.validate('HANG')
+        self.assertEqual(self.pool.validate(VALID_MESSAGE), [[], []])
+
+    def test_engine_is_pickled_with_its_tables(self):
+        engine = pickle.loads(pickle.dumps(ValidatorEngine(tables={'ADMINISTRATIVE_SEX': frozenset('X')})))
+        self.assertEqual(dict(engine.tables), {'ADMINISTRATIVE_SEX': frozenset('X')})
+
+    def test_close(self):
+        processes = [worker.process for worker in self.pool.workers]
+        self.pool.close()
+        self.assertTrue(all(not process.is_alive() for process in processes))
+        with self.assertRaises(RuntimeError):
+            self.pool.submit(VALID_MESSAGE)
+
+if __name__ == "__main__":
+    unittest.main()
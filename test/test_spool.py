@@ -0,0 +1,156 @@
+from hl7.spool import SpoolWatcher, Checkpoint, iter_messages_with_offsets, file_identity
+from hl7.parser import parse_message
+from unittest import mock
+import io
+import os
+import tempfile
+import unittest
+
+VALID_MESSAGE = r'''MSH|^~\&|XL2HL7^1.10.100.1.111111.1.101^ISO|Test Lab^99999^CLIA|CalRedie|CDPH|20241030100306||ORU^R01^ORU_R01|103|P|2.5.1|||NE|NE|||||PHLabReport-NoAck^^^ISO
+SFT|XL2HL7 Conversion|1.0|CalREDIE XC|1.0||20240105
+PID|1||8675309||Test^Rick^A||20200202|M||2033-9|1234 Main Ln.^^Sacramento^CA^95814||^PRN^PH^^1^916^1234567|||||||||H|
+ORC|RE|Gon1001^Test Lab^99999^CLIA|Doctor|||||||||NPI123456^Doctor^Doctor|||||||||Test Lab^^^^^^^^^99999|123 That Street St.^^Sacramento^CA^95814^^B|^WPN^PH^^^337^3373377|123 That Street St.^^Sacramento^CA^95814|||||||
+OBR|1|Gon1001^Test Lab^99999^CLIA|Gon1001|21416-3N. gonorrhoeae DNA NAA+probe Ql (U)|||24y0229092624||||||Not Pregnant|||NPI123456^Doctor^Doctor|^WPN^PH^^1^337^3373377|||||20241030100306|||F|||||||||||||||||||||||||
+OBX|1|CE|21416-3^N. gonorrhoeae DNA NAA+probe Ql (U)||260373001^Detected||NEG|A^Abnormal|||F|||20240228101533|||^Roche cobas 8800 System||20240229092624||||ARUP^^^^^^^^^46D0523979|2023 Floyd Ave^Salt Lake City^UT^84108||||||
+SPM|1|^8675309|| ^Body fluid sample|||||||||||||20240228101533|20240228110000|||||||||||
+'''
+INVALID_MESSAGE = "MSH|^~\\&|only a header\n"
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def drop(self, name, content):
+        with open(os.path.join(self.directory, name), 'w', newline='') as f:
+            f.write(content)
+
+    def read(self, *parts):
+        with open(os.path.join(self.directory, *parts)) as f:
+            return f.read()
+
+    def test_offsets(self):
+        data = (VALID_MESSAGE + INVALID_MESSAGE).encode()
+        f = io.BytesIO(data)
+        messages = list(iter_messages_with_offsets(f))
+        self.assertEqual([m for m, _ in messages], [VALID_MESSAGE, INVALID_MESSAGE])
+        self.assertEqual([o for _, o in messages], [len(VALID_MESSAGE.encode()), len(data)])
+        f.seek(messages[0][1])
+        self.assertEqual(list(iter_messages_with_offsets(f)), messages[1:])
+
+    def test_pass_and_fail(self):
+        self.drop('good.hl7', VALID_MESSAGE * 3)
+        self.drop('bad.hl7', VALID_MESSAGE + INVALID_MESSAGE)
+        watcher = SpoolWatcher(self.directory, settle=0)
+        self.assertEqual(watcher.run_once(), 2)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 'pass'))), ['good.hl7', 'good.hl7.report.txt'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 'fail'))), ['bad.hl7', 'bad.hl7.report.txt'])
+        self.assertEqual(self.read('pass', 'good.hl7.report.txt').count('Passed'), 3)
+        report = self.read('fail', 'bad.hl7.report.txt')
+        self.assertIn("Message 2:\n    Error: Invalid Message", report)
+        self.assertEqual(watcher.checkpoint.entries, {})
+        self.assertEqual(watcher.run_once(), 0)
+
+    def test_leading_blank_lines(self):
+        self.drop('blank.hl7', '\r\n \n' + VALID_MESSAGE * 2)
+        watcher = SpoolWatcher(self.directory, settle=0)
+        watcher.run_once()
+        self.assertEqual(self.read('pass', 'blank.hl7.report.txt'), "Message 1:\n    Passed\nMessage 2:\n    Passed\n")
+
+    def test_skips_files_still_being_written(self):
+        self.drop('uploading.hl7', VALID_MESSAGE)
+        watcher = SpoolWatcher(self.directory, settle=60)
+        self.assertEqual(watcher.run_once(), 0)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'uploading.hl7')))
+
+    def test_resume_from_checkpoint(self):
+        self.drop('big.hl7', VALID_MESSAGE * 2 + INVALID_MESSAGE + VALID_MESSAGE)
+        # simulate a crash after two messages were checkpointed and a third was half reported
+        checkpoint = Checkpoint(os.path.join(self.directory, '.hl7-checkpoint.json'))
+        report_head = "Message 1:\n    Passed\nMessage 2:\n    Passed\n"
+        with open(os.path.join(self.directory, '.big.hl7.report.txt'), 'w', newline='') as f:
+            f.write(report_head + "Message 3:\n    Err")
+        checkpoint.update('big.hl7', offset=len(VALID_MESSAGE.encode()) * 2, index=2, failed=False,
+                          report_offset=len(report_head),
+                          file=file_identity(os.stat(os.path.join(self.directory, 'big.hl7'))))
+
+        watcher = SpoolWatcher(self.directory, settle=0)
+        with mock.patch('hl7.spool.parse_message', wraps=parse_message) as parse:
+            watcher.run_once()
+        self.assertEqual(parse.call_count, 2) # only the messages after the checkpoint
+        report = self.read('fail', 'big.hl7.report.txt')
+        self.assertTrue(report.startswith(report_head + "Message 3:\n    Error: Invalid Message"))
+        self.assertTrue(report.endswith("Message 4:\n    Passed\n"))
+
+    def test_reuploaded_file_starts_over(self):
+        self.drop('big.hl7', VALID_MESSAGE * 3)
+        checkpoint = Checkpoint(os.path.join(self.directory, '.hl7-checkpoint.json'))
+        with open(os.path.join(self.directory, '.big.hl7.report.txt'), 'w', newline='') as f:
+            f.write("Message 1:\n    Passed\n")
+        # progress recorded for an earlier file with the same name
+        checkpoint.update('big.hl7', offset=len(VALID_MESSAGE.encode()), index=1, failed=False,
+                          report_offset=22, file=[0, 1, 2])
+        watcher = SpoolWatcher(self.directory, settle=0)
+        with mock.patch('hl7.spool.parse_message', wraps=parse_message) as parse:
+            watcher.run_once()
+        self.assertEqual(parse.call_count, 3)
+        self.assertEqual(self.read('pass', 'big.hl7.report.txt').count('Message'), 3)
+
+    def test_same_name_is_not_overwritten(self):
+        watcher = SpoolWatcher(self.directory, settle=0)
+        for content in [VALID_MESSAGE, VALID_MESSAGE, VALID_MESSAGE.replace('|M||', '|X||')]:
+            self.drop('daily.hl7', content)
+            watcher.run_once()
+        self.assertEqual(sorted(os.listdir(watcher.pass_dir)),
+                         ['daily-1.hl7', 'daily-1.hl7.report.txt', 'daily.hl7', 'daily.hl7.report.txt'])
+        self.assertEqual(sorted(os.listdir(watcher.fail_dir)), ['daily.hl7', 'daily.hl7.report.txt'])
+
+    def test_unreadable_file_does_not_stop_the_watcher(self):
+        self.drop('a.hl7', VALID_MESSAGE)
+        self.drop('b.hl7', VALID_MESSAGE)
+        watcher = SpoolWatcher(self.directory, settle=0)
+        process_file = watcher.process_file
+        def flaky(name):
+            if name == 'a.hl7':
+                raise PermissionError(13, 'Permission denied', name)
+            return process_file(name)
+        with mock.patch.object(watcher, 'process_file', side_effect=flaky), \
+             mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            self.assertEqual(watcher.run_once(), 1)
+        self.assertIn("a.hl7: Exception:", stderr.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(watcher.pass_dir, 'b.hl7')))
+        self.assertEqual(watcher.run_once(), 1) # retried on the next scan
+        self.assertTrue(os.path.exists(os.path.join(watcher.pass_dir, 'a.hl7')))
+
+    def test_finish_interrupted_move(self):
+        self.drop('moved.hl7', VALID_MESSAGE)
+        watcher = SpoolWatcher(self.directory, settle=0)
+        watcher.checkpoint.update('moved.hl7', offset=0, index=1, failed=False,
+                                  destination=watcher.pass_dir)
+        watcher.run_once()
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'pass', 'moved.hl7')))
+        self.assertEqual(watcher.checkpoint.entries, {})
+
+    def test_duplicate_index(self):
+        self.drop('first.hl7', VALID_MESSAGE)
+        os.utime(os.path.join(self.directory, 'first.hl7'), (0, 0)) # processed first
+        self.drop('second.hl7', VALID_MESSAGE)
+        index_path = os.path.join(self.directory, '.duplicates')
+        SpoolWatcher(self.directory, settle=0, duplicate_index_path=index_path).run_once()
+        self.assertNotIn('duplicate', self.read('pass', 'first.hl7.report.txt'))
+        self.assertIn('Possible duplicate Message Control ID (MSH-10): 103', self.read('pass', 'second.hl7.report.txt'))
+        self.assertTrue(os.path.exists(index_path))
+
+    def test_duplicate_index_saved_with_checkpoints(self):
+        self.drop('big.hl7', VALID_MESSAGE * 3)
+        index_path = os.path.join(self.directory, '.duplicates')
+        watcher = SpoolWatcher(self.directory, settle=0, checkpoint_every=1, duplicate_index_path=index_path)
+        with mock.patch.object(watcher.duplicate_index, 'save', wraps=watcher.duplicate_index.save) as save:
+            watcher.run_once()
+        self.assertEqual(save.call_count, 4) # every message, then the end of the file
+
+if __name__ == "__main__":
+    unittest.main()
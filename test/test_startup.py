@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# heavy modules that the validator must not pull in at startup
+HEAVY_MODULES = ['flask', 'waitress', 'werkzeug', 'jinja2', 'multiprocessing', 'typing']
+
+# startup target for `import hl7.cli` (which imports hl7.parser and hl7.segments),
+# measured with `python -X importtime`; a cold run is ~20ms on a laptop
+STARTUP_BUDGET_US = 100_000
+
+class TestStartup(unittest.TestCase):
+    def run_python(self, *args):
+        return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True)
+
+    def test_no_heavy_imports(self):
+        result = self.run_python('-c', 'import sys, hl7.cli; print(" ".join(sys.modules))')
+        loaded = set(result.stdout.split())
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, loaded)
+
+    def test_import_time_budget(self):
+        result = self.run_python('-X', 'importtime', '-c', 'import hl7.cli')
+        # stderr lines look like: "import time:  self [us] | cumulative | imported package"
+        cumulative = [int(line.split('|')[1]) for line in result.stderr.splitlines()
+                      if line.rstrip().endswith('| hl7.cli')]
+        self.assertEqual(len(cumulative), 1)
+        self.assertLess(cumulative[0], STARTUP_BUDGET_US)
+
+    def test_cli_validate(self):
+        message = "MSH|^~\\&|only a header"
+        result = subprocess.run([sys.executable, '-m', 'hl7', 'validate', '-'],
+                                input=message, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("-: Error: Invalid Message", result.stdout)
+
+    def test_cli_validate_keeps_going(self):
+        with tempfile.TemporaryDirectory() as directory:
+            legacy = os.path.join(directory, 'legacy.hl7')
+            with open(legacy, 'wb') as f:
+                f.write(b"\xff\xfeMSH|^~\\&|caf\xe9")
+            missing = os.path.join(directory, 'missing.hl7')
+            result = subprocess.run([sys.executable, '-m', 'hl7', 'validate', legacy, missing, '-'],
+                                    input="MSH|^~\\&|only a header", capture_output=True, text=True)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn(f"{legacy}: Error: Invalid Message", result.stdout)
+        self.assertIn(f"{missing}: Exception:", result.stderr)
+        self.assertIn("-: Error: Invalid Message", result.stdout)
+
+if __name__ == "__main__":
+    unittest.main()